@@ -0,0 +1,213 @@
+import os # For building the benchmark folder layout
+import json # For reading and writing benchmark results and baselines
+import time # For the wall time of each stage
+import pickle # For saving the stand-in model and scaler like the real ones
+import argparse # For the command line options
+import tempfile # For the default working folder
+import numpy as np # For generating synthetic bands
+import pandas as pd # For fitting the scaler with the real feature names
+import rasterio # For writing the synthetic bands
+from rasterio.transform import from_origin # For the georeferencing of the synthetic tile
+from lightgbm import LGBMClassifier # For the stand-in burn model
+from sklearn.preprocessing import MinMaxScaler # For the stand-in scaler
+import run_report # For the per-stage timings of each run
+from run_report import peak_rss # For the memory used after each stage
+from sentinel_process import find_and_process_folders, ordered_bands
+from predict_module import predict_main, expected_column_names
+from create_polygon import create_polygon
+from burn_polygons import burn_area_stats
+from block_label import block_label
+from scipy.ndimage import label # For checking the strip-wise labeling against whole-array labeling
+
+# Resolution (m) of each stacked Sentinel-2 band
+band_resolutions = {'B03': 10, 'B04': 10, 'B05': 20, 'B06': 20, 'B07': 20, 'B08': 10, 'B8A': 20, 'B09': 60, 'B12': 20}
+
+# Typical reflectances (x10000) of unburnt and burnt land for each band; burn scars are dark in NIR and bright in SWIR
+unburnt_reflectance = {'B03': 900, 'B04': 800, 'B05': 1300, 'B06': 2200, 'B07': 2600, 'B08': 2800, 'B8A': 2900, 'B09': 3000, 'B12': 1500}
+burnt_reflectance = {'B03': 700, 'B04': 800, 'B05': 1000, 'B06': 1200, 'B07': 1300, 'B08': 1300, 'B8A': 1400, 'B09': 1500, 'B12': 2400}
+
+# Function to generate a 10 m burn mask made of random disks covering about burn_density of the tile
+def synthetic_burn_mask(size, burn_density, rng):
+    mask = np.zeros((size, size), dtype=bool)
+    burnt = 0
+    while burnt < burn_density * size * size:
+        radius = int(rng.integers(3, max(4, size // 40)))
+        row, col = (int(v) for v in rng.integers(0, size, 2))
+
+        # Only draw the disk inside its bounding box
+        top, bottom = max(0, row - radius), min(size, row + radius + 1)
+        left, right = max(0, col - radius), min(size, col + radius + 1)
+        rows, cols = np.ogrid[top:bottom, left:right]
+        box = mask[top:bottom, left:right]
+        burnt -= np.count_nonzero(box)
+        box |= (rows - row) ** 2 + (cols - col) ** 2 <= radius ** 2
+        burnt += np.count_nonzero(box)
+    return mask
+
+# Function to generate the reflectances of one band from the burn mask, with noise
+def synthetic_band(band, burn_mask, rng):
+    step = band_resolutions[band] // 10
+    mask = burn_mask[::step, ::step]
+    values = np.where(mask, burnt_reflectance[band], unburnt_reflectance[band]).astype(np.float32)
+    values += rng.normal(0, 150, mask.shape)
+    return np.clip(values, 1, 10000).astype(np.uint16)
+
+# Function to write a synthetic Sentinel-2 tile folder with one .jp2 file per band
+# JPEG2000 is used when GDAL has a JPEG2000 writer, otherwise GeoTIFF content is stored under the .jp2 name
+def write_synthetic_tile(tile_folder, tile_id, size, burn_mask, rng):
+    os.makedirs(tile_folder, exist_ok=True)
+    with rasterio.Env() as env:
+        driver = 'JP2OpenJPEG' if 'JP2OpenJPEG' in env.drivers() else 'GTiff'
+    creation_options = {'QUALITY': '100', 'REVERSIBLE': 'YES'} if driver == 'JP2OpenJPEG' else {}  # Lossless JPEG2000
+    for band in ordered_bands:
+        data = synthetic_band(band, burn_mask, rng)
+        resolution = band_resolutions[band]
+        path = os.path.join(tile_folder, f"{tile_id}T033651_{band}.jp2")
+        with rasterio.open(
+            path, 'w', driver=driver, height=data.shape[0], width=data.shape[1], count=1, dtype='uint16',
+            crs='EPSG:32647', transform=from_origin(600000, 2000040, resolution, resolution), **creation_options
+        ) as dst:
+            dst.write(data, 1)
+
+# Function to train and save a small stand-in LightGBM model and MinMaxScaler on synthetic pixels
+def write_stand_in_model(model_folder, rng, n_samples=20000):
+    os.makedirs(model_folder, exist_ok=True)
+    labels = rng.random(n_samples) < 0.5
+    features = pd.DataFrame({
+        name: np.where(labels, burnt_reflectance[band], unburnt_reflectance[band]) + rng.normal(0, 150, n_samples)
+        for name, band in zip(expected_column_names, ordered_bands)
+    })
+
+    scaler = MinMaxScaler().fit(features)
+    model = LGBMClassifier(n_estimators=20, num_leaves=15, verbose=-1)
+    model.fit(pd.DataFrame(scaler.transform(features), columns=scaler.feature_names_in_), labels.astype(int))
+
+    model_path = os.path.join(model_folder, 'Model_LGBM.sav')
+    scaler_path = os.path.join(model_folder, 'min_max_scaler.pkl')
+    with open(model_path, 'wb') as f:
+        pickle.dump(model, f)
+    with open(scaler_path, 'wb') as f:
+        pickle.dump(scaler, f)
+    return model_path, scaler_path
+
+# Function to run one pipeline stage and record its wall time and the peak memory after it
+def run_stage(results, name, stage):
+    start_time = time.perf_counter()
+    output = stage()
+    own_rss, children_rss = peak_rss()
+    results[name] = {'seconds': time.perf_counter() - start_time, 'peak_rss_bytes': own_rss, 'peak_rss_children_bytes': children_rss}
+    print(f"[benchmark] {name}: {results[name]['seconds']:.2f}s")
+    return output
+
+# Function to check that labeling a predicted raster in strips gives the same regions as scipy.ndimage.label
+# Small strips are used so that many regions cross a seam
+def block_label_matches(raster_path, block_rows=64):
+    with rasterio.open(raster_path) as src:
+        mask = src.read(1) == 1
+    expected, expected_count = label(mask)
+    labels, count = block_label(mask, block_rows)
+    return count == expected_count and np.array_equal(labels, expected)
+
+# Function to run the whole pipeline on synthetic tiles and return the stage timings
+def run_benchmark(workdir, size, burn_density, n_tiles, seed, workers, chunk_size):
+    rng = np.random.default_rng(seed)
+    sentinel_folder = os.path.join(workdir, 'sentinel-2 Image')
+    raster_folder = os.path.join(workdir, 'raster')
+    raster_output_folder = os.path.join(workdir, 'raster_output')
+    shape_folder = os.path.join(workdir, 'shape_polygon')
+
+    # Synthetic inputs (not timed)
+    for i in range(n_tiles):
+        tile_id = f"T47Q{chr(ord('A') + i % 26)}B_20230228"
+        write_synthetic_tile(os.path.join(sentinel_folder, tile_id), tile_id, size, synthetic_burn_mask(size, burn_density, rng), rng)
+    model_path, scaler_path = write_stand_in_model(os.path.join(workdir, 'model'), rng)
+
+    report = run_report.reset_report()
+    stages = {}
+
+    run_stage(stages, 'find_and_process_folders', lambda: find_and_process_folders(sentinel_folder, raster_folder, workers=workers))
+    burns_by_raster = run_stage(stages, 'predict_main', lambda: predict_main(
+        base_dir=raster_folder, output_dir=raster_output_folder, model_path=model_path, scaler_path=scaler_path,
+        workers=workers, chunk_size=chunk_size))
+
+    # create_polygon once with the polygons of the prediction step, and once polygonizing the raster itself
+    def polygons(reuse):
+        for raster_path, burns in burns_by_raster.items():
+            output_shapefile_path = os.path.join(shape_folder, os.path.basename(raster_path).replace('.tif', '.shp'))
+            create_polygon(raster_path, output_shapefile_path, burns if reuse else None)
+    run_stage(stages, 'create_polygon', lambda: polygons(True))
+    run_stage(stages, 'create_polygon_from_raster', lambda: polygons(False))
+
+    # Region areas straight from the rasters, labeled strip by strip in parallel
+    run_stage(stages, 'burn_area_stats', lambda: [burn_area_stats(raster_path, workers=workers) for raster_path in burns_by_raster])
+    labels_match = all(block_label_matches(raster_path) for raster_path in burns_by_raster)
+    print(f"[benchmark] strip-wise labeling matches scipy.ndimage.label: {labels_match}")
+    if not labels_match:
+        raise RuntimeError("Strip-wise labeling does not give the same regions as scipy.ndimage.label")
+
+    return {
+        'parameters': {'size': size, 'burn_density': burn_density, 'tiles': n_tiles, 'seed': seed, 'workers': workers, 'chunk_size': chunk_size},
+        'checks': {'block_label_matches_scipy': labels_match},
+        'stages': stages,
+        'run_report': report.to_dict()['stages'],
+    }
+
+# Function to compare stage wall times with a stored baseline and print the changes
+def compare_with_baseline(results, baseline, tolerance):
+    if baseline['parameters'] != results['parameters']:
+        print("[benchmark] Warning: baseline was recorded with different parameters:", baseline['parameters'])
+
+    regressions = []
+    print("\nStage                          baseline    current   change")
+    for name, stage in results['stages'].items():
+        if name not in baseline['stages']:
+            continue
+        before = baseline['stages'][name]['seconds']
+        after = stage['seconds']
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -tolerance:
+            flag = "  faster"
+        print(f"{name:<30} {before:8.2f}s {after:8.2f}s {change:+8.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic Sentinel-2 tiles.")
+    parser.add_argument('--size', type=int, default=1098, help="Tile size in 10 m pixels, a multiple of 6 (a real tile is 10980)")
+    parser.add_argument('--burn-density', type=float, default=0.02, help="Fraction of burnt pixels")
+    parser.add_argument('--tiles', type=int, default=1, help="Number of synthetic tiles")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for reproducible tiles")
+    parser.add_argument('--workers', type=int, default=1, help="Workers for ingest and prediction")
+    parser.add_argument('--chunk-size', type=int, default=1000000, help="Pixels predicted per chunk")
+    parser.add_argument('--workdir', help="Folder for the synthetic data and outputs (a temporary folder if omitted)")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to save the results")
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help="Baseline results to compare with")
+    parser.add_argument('--save-baseline', action='store_true', help="Save these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        workdir = args.workdir or temp_folder
+        results = run_benchmark(workdir, args.size, args.burn_density, args.tiles, args.seed, args.workers, args.chunk_size)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"[benchmark] Results saved to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"[benchmark] Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n[benchmark] Slower than baseline: {', '.join(regressions)}")
+    else:
+        print(f"[benchmark] No baseline at {args.baseline}; run with --save-baseline to create one.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import sys # For failing the run when a path disagrees with the DataFrame path
+import argparse # For the command line options
+import time # For timing both inference paths
+import numpy as np # For generating or holding the pixel data
+import pandas as pd # For the DataFrame inference path
+import rasterio as rio # For reading pixels from a real raster
+from model_loader import load_model_bundle # For loading the model and scaler once
+from predict_module import preprocess_chunk, make_predictions_chunk, scaling_params, preprocess_array, predict_array
+from inference_engine import inference_backends, make_backend # For comparing the inference backends
+
+# Function to get band-major test pixels, either read from a raster or random 12-bit reflectances
+def load_pixels(raster_path, n_pixels, n_bands=9, seed=0):
+    if raster_path:
+        with rio.open(raster_path) as src:
+            rows = max(1, n_pixels // src.width)
+            data = src.read(window=((0, min(rows, src.height)), (0, src.width)))
+        return data.reshape([data.shape[0], -1])
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 4096, size=(n_bands, n_pixels), dtype=np.uint16)
+
+# Function to run the original DataFrame path on band-major pixels
+def dataframe_path(bands, bundle):
+    chunk_df = pd.DataFrame(bands.T, columns=[f"band_{i+1}" for i in range(bands.shape[0])])
+    chunk_preprocessed = preprocess_chunk(chunk_df, bundle.scaler)
+    return make_predictions_chunk(bundle.model, chunk_preprocessed)
+
+# Function to run the NumPy path on band-major pixels
+def numpy_path(bands, bundle, params):
+    features = preprocess_array(bands, params)
+    return predict_array(bundle.model, features)
+
+# Function to run an inference backend on already scaled features
+def backend_path(features, backend, num_threads):
+    return predict_array(backend, features, num_threads)
+
+# Function to time a prediction function and return its last result and its throughput
+def time_path(predict, repeat):
+    best_time = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = predict()
+        best_time = min(best_time, time.perf_counter() - start_time)
+    return result, best_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the DataFrame and NumPy inference paths and the inference backends of predict_module.")
+    parser.add_argument('--raster', help="Stacked 9-band GeoTIFF to read test pixels from (random pixels if omitted)")
+    parser.add_argument('--pixels', type=int, default=1000000, help="Number of pixels per chunk")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per path (the fastest one is reported)")
+    parser.add_argument('--model', default=r"model/Model_LGBM.sav", help="Path of the trained LightGBM model")
+    parser.add_argument('--scaler', default=r"model/min_max_scaler.pkl", help="Path of the MinMaxScaler")
+    parser.add_argument('--backend', dest='backends', action='append', choices=sorted(inference_backends),
+                        help="Inference backend to compare on the scaled features (repeatable, default sklearn and booster)")
+    parser.add_argument('--threads', type=int, help="Threads per prediction (default: all cores)")
+    args = parser.parse_args()
+
+    bundle = load_model_bundle(args.model, args.scaler)
+    params = scaling_params(bundle.scaler)
+    bands = load_pixels(args.raster, args.pixels)
+    n_pixels = bands.shape[1]
+
+    df_predictions, df_time = time_path(lambda: dataframe_path(bands, bundle), args.repeat)
+    np_predictions, np_time = time_path(lambda: numpy_path(bands, bundle, params), args.repeat)
+
+    mismatches = int(np.sum(np.asarray(df_predictions) != np.asarray(np_predictions)))
+    print(f"Pixels per chunk: {n_pixels}")
+    print(f"DataFrame path: {df_time:.3f}s ({n_pixels / df_time:,.0f} pixels/s)")
+    print(f"NumPy path:     {np_time:.3f}s ({n_pixels / np_time:,.0f} pixels/s)")
+    print(f"Speed-up: {df_time / np_time:.2f}x")
+    print(f"Mismatched predictions: {mismatches}")
+    failed = mismatches > 0
+
+    # Compare the backends on the same scaled features, against the DataFrame path's predictions
+    features = preprocess_array(bands, params)
+    print(f"\nInference backends ({args.threads or 'all'} threads):")
+    for name in args.backends or ['sklearn', 'booster']:
+        backend = make_backend(bundle.model, name, args.model)
+        backend_path(features[:1000], backend, args.threads)  # Warm up (and compile) outside the timing
+        predictions, backend_time = time_path(lambda: backend_path(features, backend, args.threads), args.repeat)
+        mismatches = int(np.sum(np.asarray(df_predictions) != np.asarray(predictions)))
+        print(f"{name:<9} {backend_time:.3f}s ({n_pixels / backend_time:,.0f} pixels/s), mismatched predictions: {mismatches}")
+        failed = failed or mismatches > 0
+
+    # Any disagreement with the DataFrame path is a failure, not just a number in the output
+    if failed:
+        print("FAILED: predictions differ from the DataFrame path.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
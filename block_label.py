@@ -0,0 +1,133 @@
+import os # For the default number of labeling threads
+import threading # For one open dataset per labeling thread
+import numpy as np # For the strip statistics and the union-find parent array
+import rasterio # For reading strips of a predicted raster
+from concurrent.futures import ThreadPoolExecutor # For labeling several strips at once
+from rasterio.windows import Window # For the strip read from the raster
+from scipy.ndimage import label # For labeling connected pixels within one strip
+
+# Labels and region statistics of one horizontal strip of the mask
+# Region ids are local to the strip (1..n, numbered in raster-scan order like scipy.ndimage.label)
+class StripLabels:
+    def __init__(self, mask, row_offset, keep_labels=False):
+        labels, self.n = label(mask)  # 4-connected
+        width = mask.shape[1]
+
+        # Pixel counts and pixel center sums (in raster rows / columns) of each region of the strip
+        burnt_pixels = np.flatnonzero(labels)
+        region_labels = labels.ravel()[burnt_pixels]
+        rows, cols = np.divmod(burnt_pixels, width)
+        self.pixel_counts = np.bincount(region_labels, minlength=self.n + 1)[1:]
+        self.row_sums = np.bincount(region_labels, weights=rows + row_offset, minlength=self.n + 1)[1:]
+        self.col_sums = np.bincount(region_labels, weights=cols, minlength=self.n + 1)[1:]
+
+        # The edge rows are all that is needed to join regions across the seams with the other strips
+        self.first_row = labels[0].copy()
+        self.last_row = labels[-1].copy()
+        self.labels = labels if keep_labels else None
+
+# Function to find the root of a region id, halving the path on the way
+def find_root(parent, region):
+    while parent[region] != region:
+        parent[region] = parent[parent[region]]
+        region = parent[region]
+    return region
+
+# Function to join the regions of consecutive strips that touch across a seam
+# Returns, for each strip-wide id (0 for background), its final label, and the number of final labels
+# The smallest id of a joined region is kept as its root: ids grow with the first pixel of each part
+# in raster-scan order, so the final labels come out in the same order as scipy.ndimage.label's
+def merge_strips(strips):
+    offsets = np.cumsum([0] + [strip.n for strip in strips])
+    parent = np.arange(offsets[-1] + 1)
+
+    for index in range(1, len(strips)):
+        upper, lower = strips[index - 1], strips[index]
+        touching = (upper.last_row > 0) & (lower.first_row > 0)
+        if not touching.any():
+            continue
+        pairs = np.unique(np.stack([upper.last_row[touching] + offsets[index - 1],
+                                    lower.first_row[touching] + offsets[index]], axis=1), axis=0)
+        for a, b in pairs:
+            root_a, root_b = find_root(parent, a), find_root(parent, b)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    # Point every id straight at its root (parents only ever point to smaller ids)
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            break
+        parent = grandparent
+
+    roots, final_labels = np.unique(parent[1:], return_inverse=True)
+    return np.concatenate([[0], final_labels + 1]), len(roots)
+
+# Function to label the strips of a mask in parallel
+# read_strip(row, rows) returns the boolean mask of rows row..row + rows - 1
+def label_strips(read_strip, height, block_rows=1024, workers=None, keep_labels=False):
+    workers = workers or os.cpu_count() or 1
+
+    def label_strip(row):
+        return StripLabels(read_strip(row, min(block_rows, height - row)), row, keep_labels)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(label_strip, range(0, height, block_rows)))
+
+# Function to get the pixel count and pixel center row / column sums of each connected region of a mask
+# Only `workers` strips of block_rows rows are in memory at once, and the regions come out in the
+# same order as with scipy.ndimage.label over the whole mask
+def region_stats(read_strip, height, block_rows=1024, workers=None):
+    strips = label_strips(read_strip, height, block_rows, workers)
+    if not strips:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    final_labels, num_features = merge_strips(strips)
+
+    # Add up the statistics of the parts of each final region
+    region_of_part = final_labels[1:] - 1
+    pixel_counts = np.bincount(region_of_part, weights=np.concatenate([strip.pixel_counts for strip in strips]), minlength=num_features)
+    row_sums = np.bincount(region_of_part, weights=np.concatenate([strip.row_sums for strip in strips]), minlength=num_features)
+    col_sums = np.bincount(region_of_part, weights=np.concatenate([strip.col_sums for strip in strips]), minlength=num_features)
+    return pixel_counts.astype(np.int64), row_sums, col_sums
+
+# Function to compute region_stats of the pixels equal to value in a band of a raster file
+# Each labeling thread reads its own strips through its own dataset, so the raster is never read whole
+def raster_region_stats(raster_path, value=1, band=1, block_rows=1024, workers=None):
+    thread_state = threading.local()
+    datasets = []
+    lock = threading.Lock()
+
+    def read_strip(row, rows):
+        src = getattr(thread_state, 'src', None)
+        if src is None:
+            src = thread_state.src = rasterio.open(raster_path)
+            with lock:
+                datasets.append(src)
+        return src.read(band, window=Window(0, row, src.width, rows)) == value
+
+    with rasterio.open(raster_path) as src:
+        height = src.height
+    try:
+        return region_stats(read_strip, height, block_rows, workers)
+    finally:
+        for src in datasets:
+            src.close()
+
+# Function to label a whole mask strip by strip, giving the same labels as scipy.ndimage.label(mask)
+# (for checking the block-wise labeling, or when the full label array is needed anyway)
+def block_label(mask, block_rows=1024, workers=None):
+    height = mask.shape[0]
+    strips = label_strips(lambda row, rows: mask[row:row + rows], height, block_rows, workers, keep_labels=True)
+    labels = np.zeros(mask.shape, dtype=np.int32)
+    if not strips:
+        return labels, 0
+    final_labels, num_features = merge_strips(strips)
+
+    offset = 0
+    for index, strip in enumerate(strips):
+        row = index * block_rows
+        strip_labels = labels[row:row + strip.labels.shape[0]]
+        burnt = strip.labels > 0
+        strip_labels[burnt] = final_labels[strip.labels[burnt] + offset]
+        offset += strip.n
+    return labels, num_features
@@ -0,0 +1,146 @@
+import os # For getting file names from paths
+import math # For calculating the UTM zone
+import numpy as np # For building the burn mask
+import pandas as pd # For the table of burn region statistics
+import geopandas as gpd # For holding the burn polygons and their attributes
+import rasterio # For reading predicted rasters
+from datetime import datetime # For formatting the fire date taken from the file name
+from shapely.geometry import shape # For converting the raster shapes into Shapely geometries
+from rasterio.features import shapes # For polygonizing connected burnt pixels
+from block_label import raster_region_stats # For labeling connected burnt pixels strip by strip when areas are counted on the raster
+from run_report import timed, tile_name # For timing the polygonize and reproject stages
+from pyproj import Transformer, CRS # For the UTM zone used for areas and the WGS84 centroids
+
+# Function to get the fire date (YYYY-MM-DD) from a Sentinel-2 file name such as T47QNB_20230228.tif
+def fire_date_from_filename(path):
+    filename = os.path.basename(path)
+    fire_date = filename.split('_')[1][:8]
+    return datetime.strptime(fire_date, '%Y%m%d').strftime('%Y-%m-%d')
+
+# Function to get the tile id (e.g. T47QNB) from a Sentinel-2 file name such as T47QNB_20230228.tif
+def tile_id_from_filename(path):
+    return os.path.basename(path).split('_')[0]
+
+# Function to get the UTM CRS of the zone containing the center of a raster
+def utm_crs_for(crs, bounds):
+    # Get the center coordinates of the raster
+    center_x = (bounds.left + bounds.right) / 2
+    center_y = (bounds.bottom + bounds.top) / 2
+
+    # Convert center coordinates to WGS84
+    transformer = Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+    center_lon, center_lat = transformer.transform(center_x, center_y)
+
+    # Calculate the UTM zone
+    utm_zone = math.floor((center_lon + 180) / 6) + 1
+    hemisphere = 'north' if center_lat >= 0 else 'south'
+
+    # Create a custom UTM CRS
+    return CRS.from_dict({
+        'proj': 'utm',
+        'zone': utm_zone,
+        'south': hemisphere == 'south'
+    })
+
+# Function to polygonize the burnt pixels (value 1) of a prediction raster in a single pass
+# Returns a GeoDataFrame in the raster CRS with, for each burn polygon:
+# its UTM geometry (utm_geometry), area_m2, centroid LATITUDE / LONGITUDE and FIRE_DATE
+# tile is the name the timings are reported under
+def vectorize_burns(raster_data, transform, crs, bounds, fire_date, tile=None):
+    with timed('polygonize', tile, pixels=raster_data.size) as counts:
+        # Create a mask for burnt areas where prediction equals 1
+        burn_condition = (raster_data == 1).astype(np.uint8)
+
+        # Generate shapes (polygons) of connected burnt pixels; the mask leaves out unburnt areas,
+        # and shapes groups 4-connected pixels just like scipy.ndimage.label would
+        polygons = [shape(geom) for geom, value in shapes(burn_condition, mask=burn_condition.astype(bool), transform=transform)]
+        counts['polygons'] = len(polygons)
+
+    gdf = gpd.GeoDataFrame(geometry=polygons, crs=crs)
+
+    # Reproject all polygons (with their holes) to the UTM zone of the raster in one batch,
+    # and get their areas in square meters
+    with timed('reproject', tile, polygons=len(gdf)):
+        gdf['utm_geometry'] = gdf.geometry.to_crs(utm_crs_for(crs, bounds))
+        gdf['area_m2'] = gdf['utm_geometry'].area
+
+    # Calculate centroids for each polygon and convert them to WGS 84 (lat/lon)
+    centroids = gdf.geometry.centroid.to_crs("EPSG:4326")
+    gdf['LATITUDE'] = centroids.y
+    gdf['LONGITUDE'] = centroids.x
+    gdf['FIRE_DATE'] = fire_date  # Assign the fire date
+
+    return gdf
+
+# Function to polygonize the burnt pixels of a predicted GeoTIFF file
+def vectorize_burn_raster(raster_path, fire_date=None):
+    # If fire date is not provided, extract it from the filename
+    if fire_date is None:
+        fire_date = fire_date_from_filename(raster_path)
+
+    with rasterio.open(raster_path) as src:
+        raster_data = src.read(1)  # Read the first band
+        return vectorize_burns(raster_data, src.transform, src.crs, src.bounds, fire_date, tile_name(raster_path))
+
+# Function to check whether a CRS is projected with coordinates in meters (e.g. the UTM zones of Sentinel-2 tiles)
+def is_metric_crs(crs):
+    return crs is not None and crs.is_projected and crs.linear_units_factor[1] == 1.0
+
+# Function to turn per-region pixel counts and row / column sums into areas and WGS84 centroids,
+# with no polygons: each region's area is its pixel count times the pixel area,
+# and its centroid is the mean of its pixel centers (the same as the centroid of its polygon)
+# Returns a DataFrame with pixel_count, area_m2, LATITUDE and LONGITUDE for each region
+def region_stats_table(pixel_counts, row_sums, col_sums, transform, crs):
+    pixel_area = abs(transform.a * transform.e - transform.b * transform.d)
+
+    # Centroids in pixel coordinates (pixel centers), then in the raster CRS, then in WGS84
+    center_cols = col_sums / np.maximum(pixel_counts, 1) + 0.5
+    center_rows = row_sums / np.maximum(pixel_counts, 1) + 0.5
+    x = transform.c + center_cols * transform.a + center_rows * transform.b
+    y = transform.f + center_cols * transform.d + center_rows * transform.e
+    lon, lat = Transformer.from_crs(crs, "EPSG:4326", always_xy=True).transform(x, y)
+
+    return pd.DataFrame({
+        'pixel_count': pixel_counts.astype(np.int64),
+        'area_m2': pixel_counts * pixel_area,
+        'LATITUDE': lat,
+        'LONGITUDE': lon,
+    })
+
+# Function to get per-region areas, centroids and the total burned area of a predicted GeoTIFF
+# Counts pixels on the raster when its CRS is metric, and falls back to UTM polygons otherwise
+# In a metric CRS the raster is labeled strip by strip from the file, so it is never read whole
+# Both ways give the same columns as region_stats_table
+def burn_area_stats(raster_path, block_rows=1024, workers=None):
+    with rasterio.open(raster_path) as src:
+        transform = src.transform
+        crs = src.crs
+        bounds = src.bounds
+
+    if is_metric_crs(crs):
+        pixel_counts, row_sums, col_sums = raster_region_stats(raster_path, 1, 1, block_rows, workers)
+        regions = region_stats_table(pixel_counts, row_sums, col_sums, transform, crs)
+    else:
+        with rasterio.open(raster_path) as src:
+            raster_data = src.read(1)  # Read the first band
+        burns = vectorize_burns(raster_data, transform, crs, bounds, None, tile_name(raster_path))
+        # The polygons follow the pixel edges, so their area in the raster CRS is a whole number of pixels
+        # (measured per polygon with shapely, as geopandas warns about areas in geographic CRSs)
+        pixel_area = abs(transform.a * transform.e - transform.b * transform.d)
+        regions = pd.DataFrame({
+            'pixel_count': np.round(np.array([polygon.area for polygon in burns.geometry]) / pixel_area).astype(np.int64),
+            'area_m2': burns['area_m2'],
+            'LATITUDE': burns['LATITUDE'],
+            'LONGITUDE': burns['LONGITUDE'],
+        })
+
+    total_area = float(regions['area_m2'].sum())
+    return regions, total_area
+
+if __name__ == "__main__":
+    # Print the burned area statistics of every predicted raster, without writing any polygons
+    root_folder = r"raster_output"
+    for raster_filename in sorted(os.listdir(root_folder)):
+        if raster_filename.endswith('_predicted.tif'):
+            regions, total_area = burn_area_stats(os.path.join(root_folder, raster_filename))
+            print(f"{raster_filename}: {len(regions)} burn regions, total burn area: {total_area:.2f} square meters")
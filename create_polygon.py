@@ -1,84 +1,105 @@
 import pandas as pd # Pandas is used for handling dataframes and structured data manipulation
 import numpy as np # Numpy is used for numerical operations, especially on arrays and matrices
-import matplotlib.pyplot as plt # Matplotlib is used for plotting and visualizing data (e.g., maps, graphs)
 import os # OS module is used for handling file and directory operations
 import geopandas as gpd # Geopandas extends Pandas to support geospatial data manipulation
 import random # Random module is used to generate random numbers, useful for sampling or simulations
-import math # Math module provides access to mathematical functions, such as for calculations
-import fiona # Fiona is used for reading and writing vector data, such as shapefiles (interacts with GeoPandas)
 import rasterio # Rasterio is used for reading and writing raster files (e.g., GeoTIFF), a key tool in GIS
-from shapely.geometry import shape, mapping # Shapely is used for manipulating and analyzing geometric objects such as points, lines, and polygons
-from scipy.ndimage import label # Scipy's ndimage module provides image processing functions, 'label' is used for labeling connected regions
-from rasterio.features import shapes # Rasterio's shapes function converts raster regions into vector shapes (useful for polygonizing raster data)
-from pyproj import Transformer, CRS # Pyproj is used for handling map projections and transforming coordinates between different CRS (Coordinate Reference Systems)
+from burn_polygons import vectorize_burn_raster, fire_date_from_filename, tile_id_from_filename # Polygonizes the burnt areas once, with UTM geometry, area, centroid and fire date
 import zipfile  # Use zipfile module for zipping files
+from run_report import timed, tile_name  # For timing the vector writes in the run report
 
-def create_polygon(input_raster_path, output_shapefile_path):
-    # Step 1: Read the raster file
+# Function to plot a downsampled overview of the raster with the selected polygons
+# preview='show' opens an interactive (blocking) window, preview='png' saves the plot to png_path
+# matplotlib is only imported here, when a preview is requested
+def plot_preview(input_raster_path, burns, polygons_to_show, preview, png_path, max_preview_size=2000):
+    # Read a decimated overview of the first band instead of the full raster
     with rasterio.open(input_raster_path) as src:
-        raster_data = src.read(1)  # Read the first band
-        transform = src.transform  # Get the affine transform
-        crs = src.crs  # Get the CRS of the input raster
-
-        # Get the center coordinates of the raster
-        center_x = (src.bounds.left + src.bounds.right) / 2
-        center_y = (src.bounds.bottom + src.bounds.top) / 2
-
-    # Create a transformer to convert from the raster's CRS to WGS84
-    transformer = Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
-
-    # Convert center coordinates to WGS84
-    center_lon, center_lat = transformer.transform(center_x, center_y)
-
-    # Calculate the UTM zone
-    utm_zone = math.floor((center_lon + 180) / 6) + 1
-    hemisphere = 'north' if center_lat >= 0 else 'south'
-
-    # Create a custom UTM CRS
-    utm_crs = CRS.from_dict({
-        'proj': 'utm',
-        'zone': utm_zone,
-        'south': hemisphere == 'south'
-    })
-
-    # Create transformer from input CRS to the appropriate UTM CRS
-    transformer_to_utm = Transformer.from_crs(crs, utm_crs, always_xy=True)
-
-    # Step 2: Extract features based on burn condition values
-    burn_condition = (raster_data == 1).astype(np.uint8)
-
-    # Label connected components
-    labeled_array, num_features = label(burn_condition)
-
-    # Step 3: Convert labeled features to polygons
-    shapes_generator = shapes(labeled_array, transform=transform)
-
-    polygons = []
-    for geom, value in shapes_generator:
-        if value > 0:  # Only take the features corresponding to burn condition
-            polygons.append(shape(geom))
-
-    projected_polygons = []
-    for polygon in polygons:
-        # Reproject polygon to UTM
-        projected_polygon = shape(mapping(polygon))
-        projected_polygon = shape({
-            'type': 'Polygon',
-            'coordinates': [
-                [
-                    transformer_to_utm.transform(x, y) for x, y in polygon.exterior.coords
-                ]
-            ]
-        })
-        projected_polygons.append(projected_polygon)
-
-    # Step 4: Calculate total area and save shapefile
-    total_area = sum(polygon.area for polygon in projected_polygons)
+        step = max(1, -(-max(src.height, src.width) // max_preview_size))
+        overview = src.read(1, out_shape=(max(1, src.height // step), max(1, src.width // step)))
+        bounds = src.bounds
 
+    if preview == 'show':
+        import matplotlib.pyplot as plt # Matplotlib is used for plotting and visualizing data (e.g., maps, graphs)
+        fig, ax = plt.subplots(figsize=(10, 10))
+    else:
+        # Non-interactive figure rendered with the Agg backend, no display needed
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(10, 10))
+        ax = fig.subplots()
+
+    # Plot the raster overview
+    ax.imshow(overview, cmap='gray', extent=(bounds.left, bounds.right, bounds.bottom, bounds.top))
+    ax.set_title("Burn Condition Raster and Random Sample of Polygons")
+
+    # Plot the selected polygons and annotate them with their ID
+    for i in polygons_to_show:
+        polygon = burns.geometry.iloc[i]
+        x, y = polygon.exterior.xy
+        ax.plot(x, y, color='red', linewidth=2)
+        centroid = polygon.centroid
+        ax.annotate(str(i+1), (centroid.x, centroid.y), color='white', fontweight='bold', ha='center', va='center')
+
+    fig.tight_layout()
+    if preview == 'show':
+        plt.show()
+    else:
+        fig.savefig(png_path)
+        print(f"Preview saved to {png_path}")
+
+# Function to write the polygons as an ESRI Shapefile (id and area_m2) and zip it with its related files
+def write_shapefile(utm_polygons, output_base):
     schema = {
         'geometry': 'Polygon',
         'properties': {'id': 'int', 'area_m2': 'float'},
     }
+    utm_polygons[['id', 'area_m2', 'geometry']].to_file(output_base + '.shp', driver='ESRI Shapefile', schema=schema, engine='fiona')
+
+    # Zip the shapefile and related files
+    zip_filename = output_base + '.zip'
+    with zipfile.ZipFile(zip_filename, 'w', compression=zipfile.ZIP_DEFLATED) as zipf:
+        for ext in ['.shp', '.shx', '.dbf', '.prj']:
+            filepath = output_base + ext
+            if os.path.exists(filepath):
+                zipf.write(filepath, os.path.basename(filepath))
+
+    return zip_filename
+
+# Function to write the polygons and all their attributes as GeoParquet
+def write_geoparquet(utm_polygons, output_base):
+    output_path = output_base + '.parquet'
+    utm_polygons.to_parquet(output_path)
+    return output_path
+
+# Function to write the polygons and all their attributes as FlatGeobuf
+def write_flatgeobuf(utm_polygons, output_base):
+    output_path = output_base + '.fgb'
+    utm_polygons.to_file(output_path, driver='FlatGeobuf')
+    return output_path
+
+# Vector output formats supported by create_polygon
+vector_writers = {
+    'shapefile': write_shapefile,
+    'geoparquet': write_geoparquet,
+    'flatgeobuf': write_flatgeobuf,
+}
+
+# Function to get the main output file of a vector format (e.g. the .zip of a shapefile)
+def vector_output_path(output_shapefile_path, output_format):
+    extensions = {'shapefile': '.zip', 'geoparquet': '.parquet', 'flatgeobuf': '.fgb'}
+    return os.path.splitext(output_shapefile_path)[0] + extensions[output_format]
+
+# burns can be passed when predict_main has already polygonized this raster with vectorize_burns
+# output_formats: any of 'shapefile' (zipped), 'geoparquet' and 'flatgeobuf'; the polygons carry
+# id, area_m2, centroid LATITUDE / LONGITUDE, FIRE_DATE and TILE_ID (the shapefile only id and area_m2)
+# preview: None (headless, no plot), 'png' (save a downsampled overview PNG next to the shapefile) or 'show' (interactive window)
+def create_polygon(input_raster_path, output_shapefile_path, burns=None, preview=None, output_formats=('shapefile',)):
+    # Steps 1-3: Read the raster file and convert the burnt areas to polygons with their UTM geometry,
+    # area, centroid and fire date (skipped when they were computed by the prediction step)
+    if burns is None:
+        burns = vectorize_burn_raster(input_raster_path, fire_date_from_filename(input_raster_path))
+
+    # Step 4: Calculate total area and save the polygons in each requested format
+    total_area = float(burns['area_m2'].sum())
 
     # Extract folder name from the shapefile path
     shapefile_folder = os.path.dirname(output_shapefile_path)
@@ -86,72 +107,49 @@ def create_polygon(input_raster_path, output_shapefile_path):
     # Create the folder if it doesn't exist
     os.makedirs(shapefile_folder, exist_ok=True)
 
-    with fiona.open(output_shapefile_path, 'w', 'ESRI Shapefile', schema=schema, crs=crs) as shp:
-        for i, polygon in enumerate(projected_polygons):
-            area_m2 = polygon.area
-            shp.write({
-                'geometry': mapping(polygon),
-                'properties': {'id': i + 1, 'area_m2': area_m2},
-            })
-
-    print(f"Shapefile saved to {output_shapefile_path}")
+    # All UTM polygons with their attributes, in the UTM CRS their coordinates are in
+    utm_polygons = gpd.GeoDataFrame(
+        {
+            'id': np.arange(1, len(burns) + 1),
+            'area_m2': burns['area_m2'].to_numpy(),
+            'LATITUDE': burns['LATITUDE'].to_numpy(),
+            'LONGITUDE': burns['LONGITUDE'].to_numpy(),
+            'FIRE_DATE': burns['FIRE_DATE'].to_numpy(),
+            'TILE_ID': tile_id_from_filename(input_raster_path),
+        },
+        geometry=burns['utm_geometry'].to_numpy(),
+        crs=burns['utm_geometry'].crs,
+    )
+
+    # Write them in one batch per format
+    shapefile_base = os.path.splitext(output_shapefile_path)[0]
+    for output_format in output_formats:
+        with timed('write_' + output_format, tile_name(input_raster_path), polygons=len(utm_polygons)):
+            output_path = vector_writers[output_format](utm_polygons, shapefile_base)
+        print(f"Polygons saved to {output_path}")
     print(f"Total burn area: {total_area:.2f} square meters\n")
 
-    # Coordinate Gathering
-    def get_coordinate_info(x, y):
-        lon, lat = transformer.transform(x, y)
-        coordinates = (lat, lon)  # Note the order: (latitude, longitude)
-        return lat, lon
-
-    # Step 5: Print properties and plot the output
-    fig, ax = plt.subplots(figsize=(10, 10))
-
-    # Plot the original raster data
-    ax.imshow(raster_data, cmap='gray', extent=(transform[2], transform[2] + transform[0] * raster_data.shape[1], 
-                                                transform[5] + transform[4] * raster_data.shape[0], transform[5]))
-    ax.set_title("Burn Condition Raster and Random Sample of Polygons")
-
+    # Step 5: Print properties of a sample of polygons and optionally plot them
     # Determine the number of polygons to show (e.g., 5 or 10% of total, whichever is smaller)
-    num_to_show = min(5, int(len(polygons) * 0.1))
+    num_to_show = min(5, int(len(burns) * 0.1))
 
     # Randomly select polygons to show
-    polygons_to_show = random.sample(range(len(polygons)), num_to_show)
+    polygons_to_show = random.sample(range(len(burns)), num_to_show)
 
-    # Plot the selected polygons and print their properties
+    # Print the properties of the selected polygons
     for i in polygons_to_show:
-        polygon = polygons[i]
-        x, y = polygon.exterior.xy
-        ax.plot(x, y, color='red', linewidth=2)
-        
-        # Get centroid of the polygon
-        centroid = polygon.centroid
-        lat, lon = get_coordinate_info(centroid.x, centroid.y)
-        area_m2 = projected_polygons[i].area  # Get area from projected polygon
-        
-        # Annotate the polygon with its ID
-        ax.annotate(str(i+1), (centroid.x, centroid.y), color='white', fontweight='bold', ha='center', va='center')
+        lat, lon = burns['LATITUDE'].iloc[i], burns['LONGITUDE'].iloc[i]
+        area_m2 = burns['area_m2'].iloc[i]  # Get area from projected polygon
         
         print(f"Polygon {i+1}:")
         print(f"  Centroid: ({lat:.6f}, {lon:.6f})")
         print(f"  Area: {area_m2:.4f} square meters")
         print()
 
-    plt.tight_layout()
-    plt.show()
-
-    # Step 6: Zip the shapefile and related files
-    shapefile_base = os.path.splitext(output_shapefile_path)[0]
-    zip_filename = shapefile_base + '.zip'
-
-    with zipfile.ZipFile(zip_filename, 'w') as zipf:
-        for ext in ['.shp', '.shx', '.dbf', '.prj']:
-            filepath = shapefile_base + ext
-            if os.path.exists(filepath):
-                zipf.write(filepath, os.path.basename(filepath))
-
-    print(f"Shapefile and related files zipped to {zip_filename}")
+    if preview is not None:
+        plot_preview(input_raster_path, burns, polygons_to_show, preview, shapefile_base + '_preview.png')
 
-    return len(polygons), num_to_show, total_area
+    return len(burns), num_to_show, total_area
 
 if __name__ == "__main__":
     # Set the root folder path where your raster files are located
@@ -171,7 +169,7 @@ if __name__ == "__main__":
             output_shapefile_name = f"{raster_filename.split('.')[0]}.shp"  # Same name as the raster but with .shp extension
             output_shapefile_path = os.path.join('shape_polygon', output_shapefile_name)
             
-            total_polygons, shown_polygons, total_area = create_polygon(input_raster_path, output_shapefile_path)
+            total_polygons, shown_polygons, total_area = create_polygon(input_raster_path, output_shapefile_path, preview='show')
             
             print(f"Processed {raster_filename}:")
             print(f"Total number of polygons: {total_polygons}")
@@ -0,0 +1,111 @@
+import os # For the path of the compiled model library
+import sys # For the shared library extension of the platform
+import threading # For sharing the compiled predictors between the prediction workers
+import numpy as np # For mapping the class probabilities to the model's classes
+from manifest import file_hash # For naming the compiled library after the model's content
+
+# Function to turn the probabilities of a LightGBM classifier into its class labels, as LGBMClassifier.predict does
+def classes_from_probabilities(classes, probabilities):
+    probabilities = np.asarray(probabilities).reshape(len(probabilities), -1)
+    if probabilities.shape[1] == 1:
+        class_index = (probabilities[:, 0] > 0.5).astype(np.intp)  # Binary model: probability of the positive class
+    else:
+        class_index = np.argmax(probabilities, axis=1)  # Multiclass model: one column per class
+    return classes[class_index]
+
+# Common interface of the inference backends: predict(features, num_threads) on a float32
+# n_pixels x n_features array (in the scaler's feature order) returns the predicted classes
+class InferenceBackend:
+    name = None
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, features, num_threads=None):
+        raise NotImplementedError
+
+# The sklearn-API model.predict, with its per-call input validation
+class SklearnBackend(InferenceBackend):
+    name = 'sklearn'
+
+    def predict(self, features, num_threads=None):
+        if num_threads is None:
+            return self.model.predict(features)
+        return self.model.predict(features, num_threads=num_threads)
+
+# LightGBM's own Booster.predict on the raw float32 array, skipping the sklearn wrapper
+class BoosterBackend(InferenceBackend):
+    name = 'booster'
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.booster = getattr(model, 'booster_', None)
+
+    def predict(self, features, num_threads=None):
+        if self.booster is None:
+            return self.model.predict(features)  # Not a LightGBM sklearn model
+        if num_threads is None:
+            probabilities = self.booster.predict(features)
+        else:
+            probabilities = self.booster.predict(features, num_threads=num_threads)
+        return classes_from_probabilities(self.model.classes_, probabilities)
+
+# The trees compiled into a native shared library with treelite and tl2cgen (optional dependencies)
+# The library is built once per model content and kept next to the model, or in cache_dir
+class TreeliteBackend(InferenceBackend):
+    name = 'treelite'
+
+    def __init__(self, model, model_path, cache_dir=None, toolchain='gcc'):
+        super().__init__(model)
+        try:
+            import treelite
+            import tl2cgen
+        except ImportError as e:
+            raise ImportError("The 'treelite' backend needs the treelite and tl2cgen packages (pip install treelite tl2cgen)") from e
+        self.tl2cgen = tl2cgen
+
+        cache_dir = cache_dir or os.path.dirname(os.path.abspath(model_path))
+        model_name = os.path.splitext(os.path.basename(model_path))[0]
+        extension = {'win32': '.dll', 'darwin': '.dylib'}.get(sys.platform, '.so')
+        self.library_path = os.path.join(cache_dir, f"{model_name}_{file_hash(model_path)[:12]}{extension}")
+
+        if not os.path.exists(self.library_path):
+            print(f"Compiling '{model_path}' into '{self.library_path}'...")
+            compiled = treelite.frontend.from_lightgbm(model.booster_)
+            temp_path = self.library_path + '.tmp' + extension
+            tl2cgen.export_lib(compiled, toolchain=toolchain, libpath=temp_path, params={'parallel_comp': os.cpu_count() or 1})
+            os.replace(temp_path, self.library_path)
+
+        # The number of threads of a compiled predictor is fixed when it is loaded, so keep one per thread count
+        self.predictors = {}
+        self.lock = threading.Lock()
+
+    def predictor(self, num_threads):
+        num_threads = num_threads or os.cpu_count() or 1
+        with self.lock:
+            if num_threads not in self.predictors:
+                self.predictors[num_threads] = self.tl2cgen.Predictor(self.library_path, nthread=num_threads)
+            return self.predictors[num_threads]
+
+    def predict(self, features, num_threads=None):
+        matrix = self.tl2cgen.DMatrix(features, dtype='float32')
+        probabilities = self.predictor(num_threads).predict(matrix)
+        return classes_from_probabilities(self.model.classes_, probabilities)
+
+# Backend name -> backend class
+inference_backends = {
+    'sklearn': SklearnBackend,
+    'booster': BoosterBackend,
+    'treelite': TreeliteBackend,
+}
+
+# Function to wrap a loaded model in the requested inference backend
+# model_path is needed by the 'treelite' backend to find or build the compiled library
+def make_backend(model, backend='booster', model_path=None, cache_dir=None):
+    if backend not in inference_backends:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {sorted(inference_backends)}")
+    if backend == 'treelite':
+        if model_path is None:
+            raise ValueError("The 'treelite' backend needs the path of the model")
+        return TreeliteBackend(model, model_path, cache_dir)
+    return inference_backends[backend](model)
@@ -1,20 +1,39 @@
 import os
+import sys
+import argparse
+import logging
+from datetime import datetime
+from manifest import Manifest
+from run_report import reset_report
 from sentinel_process import find_and_process_folders
 from predict_module import predict_main
-from create_polygon import create_polygon
+from inference_engine import inference_backends
+from time_series import time_series_main
+from predict_service import serve
+from create_polygon import create_polygon, vector_output_path, vector_writers
+from burn_polygons import burn_area_stats
 
-def main():
-    # Step 1: Process Sentinel-2 images
-    root_folder = r'sentinel-2 Image'
-    output_folder = r'raster'
-    find_and_process_folders(root_folder, output_folder)
-    
-    # Step 2: Make predictions
-    predict_main()
-    
-    # Step 3: Create polygons
-    raster_output_folder = r"raster_output"
-    shape_output_folder = r"shape_polygon"
+# Step 1: Process Sentinel-2 images
+def run_ingest(args, manifest):
+    find_and_process_folders(args.sentinel_dir, args.raster_dir, workers=args.workers, band_workers=args.band_workers,
+                             ingest_mode=args.ingest_mode, manifest=manifest, output_format=args.output_format,
+                             compression=args.compression)
+
+# Step 2: Make predictions (and polygonize the burnt areas of each new prediction)
+def run_predict(args, manifest):
+    return predict_main(manifest=manifest, base_dir=args.raster_dir, output_dir=args.raster_output_dir,
+                        model_path=args.model, scaler_path=args.scaler, workers=args.workers,
+                        queue_depth=args.queue_depth, chunk_size=args.chunk_size, block_size=args.block_size,
+                        use_dataset_mask=args.use_dataset_mask, output_format=args.output_format,
+                        compression=args.compression, backend=args.backend,
+                        polygonize=getattr(args, 'area_mode', 'polygons') == 'polygons')
+
+# Step 3: Create polygons
+def run_polygon(args, manifest, burns_by_raster=None):
+    raster_output_folder = args.raster_output_dir
+    shape_output_folder = args.shape_dir
+    output_formats = args.formats or ['shapefile']  # Any of 'shapefile', 'geoparquet' and 'flatgeobuf'
+    burns_by_raster = burns_by_raster or {}
     
     # Ensure the shape_output_folder exists
     os.makedirs(shape_output_folder, exist_ok=True)
@@ -26,8 +45,20 @@ def main():
         input_raster_path = os.path.join(raster_output_folder, raster_filename)
         output_shapefile_name = f"{os.path.splitext(raster_filename)[0]}.shp"
         output_shapefile_path = os.path.join(shape_output_folder, output_shapefile_name)
+
+        # Skip rasters whose vector outputs (and PNG preview) are all up to date; a preview to show is always drawn
+        output_paths = [vector_output_path(output_shapefile_path, output_format) for output_format in output_formats]
+        if args.preview == 'png':
+            output_paths.append(os.path.splitext(output_shapefile_path)[0] + '_preview.png')
+        if (manifest is not None and args.preview != 'show'
+                and all(manifest.is_up_to_date('polygon', output_path, [input_raster_path]) for output_path in output_paths)):
+            print(f"Skipping {raster_filename}: polygons are up to date.\n")
+            continue
         
-        total_polygons, shown_polygons, total_area = create_polygon(input_raster_path, output_shapefile_path)
+        # Reuse the polygons from the prediction step when this raster was just predicted
+        burns = burns_by_raster.get(os.path.abspath(input_raster_path))
+        total_polygons, shown_polygons, total_area = create_polygon(input_raster_path, output_shapefile_path, burns,
+                                                                    preview=args.preview, output_formats=output_formats)
         
         print(f"Processed {raster_filename}:")
         print(f"Total number of polygons: {total_polygons}")
@@ -35,5 +66,159 @@ def main():
         print(f"Total burn area: {total_area:.2f} square meters")
         print()
 
+        if manifest is not None:
+            for output_path in output_paths:
+                manifest.record('polygon', output_path, [input_raster_path])
+
+# Step 3 without polygons: burn region areas and centroids counted on the predicted rasters
+# (falls back to UTM polygons for rasters whose CRS is not metric), saved as one CSV per raster
+def run_stats(args, manifest):
+    os.makedirs(args.stats_dir, exist_ok=True)
+    raster_files = [f for f in os.listdir(args.raster_output_dir) if f.endswith('_predicted.tif')]
+
+    for raster_filename in raster_files:
+        input_raster_path = os.path.join(args.raster_output_dir, raster_filename)
+        output_csv_path = os.path.join(args.stats_dir, f"{os.path.splitext(raster_filename)[0]}_regions.csv")
+        if manifest is not None and manifest.is_up_to_date('stats', output_csv_path, [input_raster_path]):
+            print(f"Skipping {raster_filename}: burn area statistics are up to date.\n")
+            continue
+
+        try:
+            regions, total_area = burn_area_stats(input_raster_path, workers=args.workers)
+            regions.to_csv(output_csv_path, index_label='id')
+        except Exception as e:
+            print(f"An error occurred while processing file {input_raster_path}: {e}\n")
+            continue
+
+        print(f"Processed {raster_filename}:")
+        print(f"Total number of burn regions: {len(regions)}")
+        print(f"Total burn area: {total_area:.2f} square meters")
+        print()
+
+        if manifest is not None:
+            manifest.record('stats', output_csv_path, [input_raster_path])
+
+# Time-series mode: predict only the new dates of each tile and write the newly burnt pixels since the date before
+def run_timeseries(args, manifest):
+    return time_series_main(manifest=manifest, base_dir=args.raster_dir, cache_dir=args.cache_dir, output_dir=args.delta_dir,
+                            model_path=args.model, scaler_path=args.scaler, backend=args.backend, chunk_size=args.chunk_size,
+                            block_size=args.block_size, output_format=args.output_format, compression=args.compression)
+
+# Prediction service: keep the model loaded and answer prediction requests over HTTP until interrupted
+def run_serve(args, manifest):
+    serve(host=args.host, port=args.port, raster_dir=args.raster_dir, model_path=args.model, scaler_path=args.scaler,
+          backend=args.backend, chunk_size=args.chunk_size, block_size=args.block_size,
+          max_batch_pixels=args.max_batch_pixels, max_wait=args.max_wait_ms / 1000)
+
+# Run all three steps
+def run_all(args, manifest):
+    run_ingest(args, manifest)
+    burns_by_raster = run_predict(args, manifest)
+    if args.area_mode == 'raster':
+        run_stats(args, manifest)
+    else:
+        run_polygon(args, manifest, burns_by_raster)
+
+# Function to build the command line interface, with one subcommand per step and 'run' for the whole pipeline
+def build_parser():
+    # Options shared by every subcommand
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--manifest', default='pipeline_manifest.json', help="Manifest of produced outputs, used to skip up-to-date work")
+    common.add_argument('--no-manifest', action='store_true', help="Reprocess everything and do not update the manifest")
+    common.add_argument('--report-dir', default='run_reports', help="Folder for the JSON run report")
+    common.add_argument('--workers', type=int, default=1, help="Tiles ingested at once / chunks predicted at once")
+
+    ingest = argparse.ArgumentParser(add_help=False)
+    ingest.add_argument('--sentinel-dir', default=r'sentinel-2 Image', help="Folder with the Sentinel-2 .jp2 images")
+    ingest.add_argument('--band-workers', type=int, help="GDAL decode threads per tile in fused mode (default: GDAL's default), bands resampled at once in resample mode (default: 1)")
+    ingest.add_argument('--ingest-mode', choices=['fused', 'resample'], default='fused', help="Single-pass VRT stack or per-band temp files")
+
+    # Layout of the rasters written by ingest and predict
+    raster_format = argparse.ArgumentParser(add_help=False)
+    raster_format.add_argument('--output-format', choices=['COG', 'GTiff'], default='COG', help="Cloud-Optimized GeoTIFF with overviews or plain tiled GeoTIFF")
+    raster_format.add_argument('--compression', choices=['DEFLATE', 'ZSTD'], default='DEFLATE', help="Compression of the written rasters")
+
+    raster = argparse.ArgumentParser(add_help=False)
+    raster.add_argument('--raster-dir', default=r'raster', help="Folder with the stacked 10 m rasters")
+
+    predict = argparse.ArgumentParser(add_help=False)
+    predict.add_argument('--model', default=r"model/Model_LGBM.sav", help="Trained LightGBM model")
+    predict.add_argument('--scaler', default=r"model/min_max_scaler.pkl", help="MinMaxScaler of the model")
+    predict.add_argument('--queue-depth', type=int, default=2, help="Chunks read ahead of the prediction workers")
+    predict.add_argument('--chunk-size', type=int, default=1000000, help="Approximate number of pixels predicted at a time")
+    predict.add_argument('--block-size', type=int, default=512, help="Tile size of the predicted GeoTIFF")
+    predict.add_argument('--backend', choices=sorted(inference_backends), default='booster', help="Inference backend ('treelite' needs treelite and tl2cgen)")
+    predict.add_argument('--use-dataset-mask', action='store_true', help="Take valid pixels from the dataset mask instead of all-zero bands")
+
+    raster_output = argparse.ArgumentParser(add_help=False)
+    raster_output.add_argument('--raster-output-dir', default=r"raster_output", help="Folder with the predicted rasters")
+
+    polygon = argparse.ArgumentParser(add_help=False)
+    polygon.add_argument('--shape-dir', default=r"shape_polygon", help="Folder for the burn polygons")
+    polygon.add_argument('--format', dest='formats', action='append', choices=sorted(vector_writers), help="Vector output format (repeatable, default shapefile)")
+    polygon.add_argument('--preview', choices=['png', 'show'], help="Save (png) or show a preview plot of each raster")
+
+    stats = argparse.ArgumentParser(add_help=False)
+    stats.add_argument('--stats-dir', default=r"burn_stats", help="Folder for the CSV of burn region areas and centroids of each raster")
+
+    area_mode = argparse.ArgumentParser(add_help=False)
+    area_mode.add_argument('--area-mode', choices=['polygons', 'raster'], default='polygons',
+                           help="Step 3: write burn polygons, or only count region areas on the rasters (no polygonizing)")
+
+    timeseries = argparse.ArgumentParser(add_help=False)
+    timeseries.add_argument('--cache-dir', default=r"feature_cache", help="Folder for the cached features and predictions of each tile and date")
+    timeseries.add_argument('--delta-dir', default=r"raster_delta", help="Folder for the newly burnt masks between consecutive dates")
+
+    service = argparse.ArgumentParser(add_help=False)
+    service.add_argument('--host', default='127.0.0.1', help="Address the service listens on")
+    service.add_argument('--port', type=int, default=8765, help="Port the service listens on")
+    service.add_argument('--max-batch-pixels', type=int, default=4000000, help="Pixels of concurrent requests predicted in one model call")
+    service.add_argument('--max-wait-ms', type=float, default=10, help="How long a batch waits for more requests")
+
+    parser = argparse.ArgumentParser(description="Sentinel-2 Image Processing Pipeline for Burn Area Detection")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('ingest', parents=[common, ingest, raster, raster_format], help="Step 1: resample and stack the Sentinel-2 bands")
+    subparsers.add_parser('predict', parents=[common, raster, predict, raster_output, raster_format], help="Step 2: predict burn areas")
+    subparsers.add_parser('polygon', parents=[common, raster_output, polygon], help="Step 3: create burn polygons")
+    subparsers.add_parser('run', parents=[common, ingest, raster, predict, raster_output, polygon, raster_format, stats, area_mode], help="Run all three steps (default)")
+    subparsers.add_parser('stats', parents=[common, raster_output, stats], help="Step 3 without polygons: burn region areas counted on the rasters")
+    subparsers.add_parser('timeseries', parents=[common, raster, predict, timeseries, raster_format], help="Predict new dates of each tile and write newly burnt masks")
+    subparsers.add_parser('serve', parents=[common, raster, predict, service], help="Keep the model loaded and serve predictions over HTTP")
+    return parser
+
+# Subcommand -> step function
+commands = {
+    'ingest': run_ingest,
+    'predict': run_predict,
+    'polygon': run_polygon,
+    'run': run_all,
+    'stats': run_stats,
+    'timeseries': run_timeseries,
+    'serve': run_serve,
+}
+
+def main(argv=None):
+    parser = build_parser()
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    # Without a subcommand (no arguments, or only options such as --workers 4), run the whole pipeline
+    if not argv or (argv[0] not in commands and argv[0] not in ('-h', '--help')):
+        argv = ['run'] + argv
+    args = parser.parse_args(argv)
+
+    # Set up logging configuration for debugging
+    logging.basicConfig(level=logging.INFO)
+
+    # Collect stage timings for the run report
+    report = reset_report()
+
+    # Manifest of already produced outputs, so only new scenes are processed
+    manifest = None if args.no_manifest else Manifest(args.manifest)
+
+    commands[args.command](args, manifest)
+
+    # Write the JSON run report (per-stage and per-tile timings, throughput, peak memory)
+    report.write(os.path.join(args.report_dir, f"{args.command}_{datetime.now():%Y%m%d_%H%M%S}.json"))
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
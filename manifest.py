@@ -0,0 +1,61 @@
+import os # For file paths and file sizes / modification times
+import json # For storing the manifest on disk
+import hashlib # For hashing small files such as the model and the scaler
+
+# Function to describe a large input file cheaply by its size and modification time
+def file_signature(path):
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+# Function to hash the content of a (small) file
+def file_hash(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+# Function to identify the model and scaler used for predictions by their content
+def model_identity(model_path, scaler_path):
+    return {
+        'model': file_hash(model_path),
+        'scaler': file_hash(scaler_path),
+    }
+
+# Manifest of the outputs produced by each pipeline stage and the inputs they were built from
+# An output is up to date when it still exists and its inputs (and model identity) have not changed
+class Manifest:
+    def __init__(self, path='pipeline_manifest.json'):
+        self.path = path
+        self.entries = {}
+
+        # Load the manifest of previous runs if there is one
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    # Function to build the entry stored for an output
+    def make_entry(self, input_paths, extra=None):
+        return {
+            'inputs': [file_signature(p) for p in sorted(input_paths)],
+            'extra': extra,
+        }
+
+    # Function to check whether an output can be skipped
+    def is_up_to_date(self, stage, output_path, input_paths, extra=None):
+        entry = self.entries.get(stage, {}).get(os.path.abspath(output_path))
+        if entry is None or not os.path.exists(output_path):
+            return False
+        return entry == self.make_entry(input_paths, extra)
+
+    # Function to record a freshly produced output and save the manifest
+    def record(self, stage, output_path, input_paths, extra=None):
+        self.entries.setdefault(stage, {})[os.path.abspath(output_path)] = self.make_entry(input_paths, extra)
+        self.save()
+
+    # Function to write the manifest to disk (through a temporary file so it is never left half written)
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(temp_path, self.path)
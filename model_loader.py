@@ -0,0 +1,33 @@
+import os # For building the cache key from absolute file paths
+import pickle # For loading the pickled LightGBM model and MinMaxScaler
+import time # For reporting how long loading took
+
+# Trained LightGBM model and the MinMaxScaler it was trained with, loaded together once
+class ModelBundle:
+    def __init__(self, model_path, scaler_path):
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+
+        start_time = time.perf_counter()
+
+        # Load the MinMaxScaler for normalization
+        with open(scaler_path, 'rb') as f:
+            self.scaler = pickle.load(f)
+
+        # Load the trained LightGBM model
+        with open(model_path, 'rb') as f:
+            self.model = pickle.load(f)
+
+        self.load_time = time.perf_counter() - start_time
+        print(f"Loaded model '{model_path}' and scaler '{scaler_path}' in {self.load_time:.3f}s")
+
+# Bundles already loaded in this process, keyed by their model and scaler paths
+loaded_bundles = {}
+
+# Function to get the model bundle, loading it only the first time it is requested in a process
+# The prediction workers are threads, so they all share the bundle loaded here
+def load_model_bundle(model_path=r"model/Model_LGBM.sav", scaler_path=r"model/min_max_scaler.pkl"):
+    key = (os.path.abspath(model_path), os.path.abspath(scaler_path))
+    if key not in loaded_bundles:
+        loaded_bundles[key] = ModelBundle(model_path, scaler_path)
+    return loaded_bundles[key]
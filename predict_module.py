@@ -4,60 +4,43 @@ import pandas as pd # used for handling and manipulating structured data, like D
 import pickle # used to serialize and deserialize Python objects. You are using it to load the trained machine learning model (LightGBM) and the MinMaxScaler, which were saved as .sav and .pkl files respectively.
 from collections import Counter # from the collections module helps count the occurrences of elements in an iterable. In your case, it counts the number of burnt and unburnt pixels predicted by the model.
 import os # used to handle file paths, directory creation, and file operations such as finding GeoTIFF files in directories or saving new files.
-import geopandas as gpd # simplifies working with geospatial data in Python. It extends pandas to support spatial operations on geometries (like polygons or points), and allows you to convert raster data into GeoDataFrames.
-from shapely.geometry import shape # library for creating and manipulating geometric objects (points, lines, polygons). Here, shape() converts the raster shapes into Shapely geometries, which can then be processed further.
-from rasterio.features import shapes # function is used to extract polygonal shapes from raster data, based on labeled regions or connected pixels. You use it to generate shapes from predicted burnt areas.
-from scipy.ndimage import label # This function from scipy.ndimage labels connected regions in a binary mask (in your case, regions of burnt pixels). It helps in identifying and grouping connected burnt areas.
-from datetime import datetime # helps in working with date and time. It is used to extract and format the fire dates from the filenames of the input raster files.
+from burn_polygons import vectorize_burns, fire_date_from_filename # polygonizes the predicted burnt areas once, with centroid, area and fire date, for both the result table and the shapefile.
+from model_loader import load_model_bundle # loads the model and the scaler once per process instead of once per raster
+from inference_engine import InferenceBackend, BoosterBackend, make_backend # runs the model through sklearn, the LightGBM booster or a compiled library
+from manifest import model_identity # identifies the model and scaler by content, so predictions are redone when either of them changes
+import queue # bounded queue between the thread reading raster windows and the prediction workers.
+import threading # runs the raster reader alongside the prediction workers.
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED # pool of prediction workers; LightGBM releases the GIL while predicting.
+from rasterio.windows import Window # describes the part of the raster read and predicted at a time.
+from sentinel_process import translate_raster # converts the streamed prediction GeoTIFF into a Cloud-Optimized GeoTIFF, raising if GDAL fails.
+from run_report import timed, tile_name # times each stage (read, scale, predict, write, polygonize) of each tile for the run report.
 import logging # used for tracking events that happen when some software runs. In your case, it is useful for debugging and keeping track of errors or significant events during the prediction process.
 
-# Set up logging configuration for debugging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Function to process predictions and generate a GeoDataFrame containing fire events
-def process_predictions(predictions, original_tif_path, fire_date=None):
+# burns can be passed when the predictions have already been polygonized with vectorize_burns
+def process_predictions(predictions, original_tif_path, fire_date=None, burns=None):
     # If fire date is not provided, extract it from the filename
     if fire_date is None:
-        filename = os.path.basename(original_tif_path)
-        fire_date = filename.split('_')[1][:8]
-        fire_date = datetime.strptime(fire_date, '%Y%m%d').strftime('%Y-%m-%d')
+        fire_date = fire_date_from_filename(original_tif_path)
 
     # Open the original GeoTIFF file to extract metadata like transform and CRS
     with rio.open(original_tif_path) as src:
         transform = src.transform
         crs = src.crs
+        bounds = src.bounds
         height, width = src.shape
 
     # Reshape predictions to match the dimensions of the original raster
     raster_data = predictions.reshape((height, width))
 
-    # Create a mask for burnt areas where prediction equals 1
-    burn_condition = (raster_data == 1).astype(np.uint8)
-    
-    # Label connected regions of burnt pixels
-    labeled_array, num_features = label(burn_condition)
-    
-    # Generate shapes (polygons) from labeled regions
-    shapes_generator = shapes(labeled_array, transform=transform)
-
-    # Store the polygons corresponding to burnt areas
-    polygons = []
-    for geom, value in shapes_generator:
-        if value > 0:
-            polygons.append(shape(geom))
-
-    # Create a GeoDataFrame to hold the polygons
-    gdf = gpd.GeoDataFrame(geometry=polygons, crs=crs)
-    gdf = gdf.to_crs("EPSG:4326")  # Convert to WGS 84 (lat/lon)
-    
-    # Calculate centroids for each polygon to extract latitude and longitude
-    gdf['LATITUDE'] = gdf.geometry.centroid.y
-    gdf['LONGITUDE'] = gdf.geometry.centroid.x
-    gdf['FIRE_DATE'] = fire_date  # Assign the fire date
+    # Polygonize the burnt areas, with their centroids and fire date
+    if burns is None:
+        burns = vectorize_burns(raster_data, transform, crs, bounds, fire_date)
 
     # Prepare the final result dataframe with relevant information
-    result_df = gdf[['LATITUDE', 'LONGITUDE', 'FIRE_DATE']]
+    result_df = burns[['LATITUDE', 'LONGITUDE', 'FIRE_DATE']]
     
     # Count the number of burnt and unburnt pixels
     burn_count = np.sum(raster_data == 1)
@@ -69,14 +52,14 @@ def process_predictions(predictions, original_tif_path, fire_date=None):
 
     return result_df
 
+# Expected column names for each band of the stack (B03, B04, B05, B06, B07, B08, B8A, B09, B12)
+expected_column_names = [
+    'Band_3_Post', 'Band_4_Post', 'Band_5_Post', 'Band_6_Post',
+    'Band_7_Post', 'Band_8_Post', 'Band_8A_Post', 'Band_9_Post', 'Band_12_Post'
+]
+
 # Function to preprocess a chunk of data before making predictions
 def preprocess_chunk(chunk, scaler):
-    # Define the expected column names for each band after renaming
-    expected_column_names = [
-        'Band_3_Post', 'Band_4_Post', 'Band_5_Post', 'Band_6_Post',
-        'Band_7_Post', 'Band_8_Post', 'Band_8A_Post', 'Band_9_Post', 'Band_12_Post'
-    ]
-    
     # Rename the columns of the chunk to match the expected names
     rename_dict = {f"band_{i+1}": name for i, name in enumerate(expected_column_names)}
     chunk_rename = chunk.rename(columns=rename_dict)
@@ -96,6 +79,260 @@ def make_predictions_chunk(model, chunk):
     y_pred = model.predict(chunk)
     return y_pred
 
+# Function to precompute what the NumPy inference path needs from the scaler:
+# the band index of each scaler feature, and the MinMaxScaler factors (x * scale + offset)
+def scaling_params(scaler, dtype=np.float32):
+    permutation = [expected_column_names.index(name) for name in scaler.feature_names_in_]
+    scale = scaler.scale_.astype(dtype)
+    offset = scaler.min_.astype(dtype)
+    clip_range = scaler.feature_range if getattr(scaler, 'clip', False) else None
+    return permutation, scale, offset, clip_range
+
+# Function to preprocess band-major pixels (n_bands x n_pixels) without any DataFrame
+# Gives the same values as preprocess_chunk in a single contiguous array (one copy, scaled in place)
+# out can be a preallocated n_pixels x n_features array to fill instead of allocating a new one
+def preprocess_array(bands, params, dtype=np.float32, out=None):
+    permutation, scale, offset, clip_range = params
+
+    # Gather the bands in the scaler's feature order into a pixel-major array
+    features = np.empty((bands.shape[1], len(permutation)), dtype=dtype) if out is None else out
+    for column, band_index in enumerate(permutation):
+        features[:, column] = bands[band_index]
+
+    # MinMaxScaler.transform, fused and in place
+    features *= scale
+    features += offset
+    if clip_range is not None:
+        np.clip(features, clip_range[0], clip_range[1], out=features)
+
+    return features
+
+# Function to make predictions on a feature array with an inference backend (see inference_engine)
+# A plain model is run through the LightGBM booster directly, which gives the same classes
+# as model.predict without the sklearn wrapper's per-call validation
+def predict_array(model, features, num_threads=None):
+    if not isinstance(model, InferenceBackend):
+        model = BoosterBackend(model)
+    return model.predict(features, num_threads)
+
+# Reusable work arrays of one prediction worker, sized for the largest chunk (max_pixels pixels)
+# With them, predicting a chunk only allocates the model's own output
+class ChunkScratch:
+    def __init__(self, n_bands, n_features, max_pixels, band_dtype, dtype=np.float32):
+        self.valid = np.empty(max_pixels, dtype=bool)  # Valid-pixel mask
+        self.nonzero = np.empty(max_pixels, dtype=bool)  # Non-zero pixels of one band
+        self.compact = np.empty((n_bands, max_pixels), dtype=band_dtype)  # Valid pixels only, band-major
+        self.features = np.empty((max_pixels, n_features), dtype=dtype)  # Scaled pixel-major features
+
+# Function to find the valid pixels of a window: from the dataset mask if given, otherwise
+# every pixel with at least one non-zero band (zero-filled areas outside the swath are not valid)
+# With scratch, the mask is built band by band in its preallocated arrays
+def valid_pixel_mask(bands, dataset_mask=None, scratch=None):
+    if dataset_mask is not None:
+        return dataset_mask.reshape(-1) != 0
+    if scratch is None:
+        return np.any(bands != 0, axis=0)
+
+    n_pixels = bands.shape[1]
+    valid = scratch.valid[:n_pixels]
+    nonzero = scratch.nonzero[:n_pixels]
+    np.not_equal(bands[0], 0, out=valid)
+    for band in bands[1:]:
+        np.not_equal(band, 0, out=nonzero)
+        np.logical_or(valid, nonzero, out=valid)
+    return valid
+
+# Function to predict one window of band data (n_bands x rows x cols) and return a rows x cols array
+# Only valid pixels are sent to the model; the others are predicted as 0 (unburnt)
+# scratch (a ChunkScratch) and out (a uint8 array of at least rows * cols pixels) avoid allocating per chunk
+def predict_chunk(chunk, model, params, num_threads=None, dataset_mask=None, tile=None, scratch=None, out=None):
+    n_bands, rows, cols = chunk.shape
+    bands = chunk.reshape([n_bands, -1])
+    if out is None:
+        predictions = np.zeros(rows * cols, dtype=np.uint8)
+    else:
+        predictions = out[:rows * cols]
+        predictions.fill(0)
+
+    # Skip the model entirely for windows without any valid pixel
+    valid = valid_pixel_mask(bands, dataset_mask, scratch)
+    n_valid = np.count_nonzero(valid)
+    if n_valid == 0:
+        return predictions.reshape((rows, cols))
+
+    # Compact the valid pixels, predict them, and scatter the results back
+    if n_valid < valid.size:
+        if scratch is None:
+            bands = bands[:, valid]
+        else:
+            valid_index = np.flatnonzero(valid)
+            for band, compact in zip(bands, scratch.compact):
+                np.take(band, valid_index, out=compact[:n_valid], mode='clip')  # 'raise' would buffer out
+            bands = scratch.compact[:, :n_valid]
+    features = None if scratch is None else scratch.features[:n_valid]
+    with timed('scale', tile, pixels=n_valid):
+        chunk_preprocessed = preprocess_array(bands, params, out=features)
+    with timed('predict', tile, pixels=n_valid):
+        chunk_predictions = predict_array(model, chunk_preprocessed, num_threads)
+    if n_valid < valid.size:
+        predictions[valid] = chunk_predictions
+    else:
+        predictions[:] = chunk_predictions
+    return predictions.reshape((rows, cols))
+
+# Buffers one window travels with from the reader to the writer: its bands, read in the raster's
+# own dtype, and its predictions. They are sized for the largest window and reused for every window
+class ChunkBuffers:
+    def __init__(self, n_bands, max_pixels, band_dtype):
+        self.n_bands = n_bands
+        self.bands = np.empty(n_bands * max_pixels, dtype=band_dtype)
+        self.predictions = np.empty(max_pixels, dtype=np.uint8)
+
+    # Contiguous n_bands x rows x cols view of the band buffer, for reading a window into
+    def chunk(self, window):
+        rows, cols = int(window.height), int(window.width)
+        return self.bands[:self.n_bands * rows * cols].reshape((self.n_bands, rows, cols))
+
+# Function to predict a list of windows of an open raster with reading, predicting and writing overlapped
+# A reader thread reads up to queue_depth windows ahead, `workers` threads predict them,
+# and write_window(window, predictions) is called (in this thread) as each window finishes
+# Windows are read into a fixed set of reused ChunkBuffers and each worker keeps its own ChunkScratch,
+# so no array is allocated per window; predictions passed to write_window are only valid during the call
+# With use_dataset_mask, valid pixels come from the dataset mask (nodata / internal mask) instead of all-zero bands
+# tile is the name the timings are reported under
+def predict_windows(src, windows, model, params, write_window, workers=1, queue_depth=2, use_dataset_mask=False, tile=None):
+    windows = list(windows)
+    if not windows:
+        return
+    read_queue = queue.Queue(maxsize=max(1, queue_depth))
+    end_of_windows = object()
+    reader_errors = []
+    stop_reading = threading.Event()
+
+    # One set of buffers for the window being read, the queued windows and the windows being predicted
+    max_pixels = max(int(window.width) * int(window.height) for window in windows)
+    free_buffers = queue.Queue()
+    for _ in range(max(1, queue_depth) + workers + 1):
+        free_buffers.put(ChunkBuffers(src.count, max_pixels, src.dtypes[0]))
+
+    # Function to take a free set of buffers, giving up when reading is stopped
+    def next_free_buffers():
+        while not stop_reading.is_set():
+            try:
+                return free_buffers.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    # Read windows ahead of the workers; only this thread touches the dataset
+    def reader():
+        try:
+            for window in windows:
+                buffers = next_free_buffers()
+                if buffers is None:
+                    break
+                with timed('read', tile, pixels=window.width * window.height):
+                    dataset_mask = src.dataset_mask(window=window) if use_dataset_mask else None
+                    chunk = src.read(window=window, out=buffers.chunk(window))
+                read_queue.put((window, buffers, chunk, dataset_mask))
+        except Exception as e:
+            reader_errors.append(e)
+        finally:
+            read_queue.put(end_of_windows)
+
+    # Share the cores between the workers instead of every prediction using all of them
+    num_threads = max(1, (os.cpu_count() or 1) // workers) if workers > 1 else None
+
+    # Work arrays of each prediction thread, created on its first window
+    worker_state = threading.local()
+
+    def predict_buffers(buffers, chunk, dataset_mask):
+        scratch = getattr(worker_state, 'scratch', None)
+        if scratch is None:
+            scratch = worker_state.scratch = ChunkScratch(src.count, len(params[0]), max_pixels, src.dtypes[0])
+        return predict_chunk(chunk, model, params, num_threads, dataset_mask, tile, scratch, buffers.predictions)
+
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    reader_thread.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+
+            # Function to write out the windows that have finished so far
+            def write_finished(return_when):
+                finished, _ = wait(pending, return_when=return_when)
+                for future in finished:
+                    window, buffers = pending.pop(future)
+                    write_window(window, future.result())
+                    free_buffers.put(buffers)  # Hand the buffers back to the reader
+
+            while True:
+                item = read_queue.get()
+                if item is end_of_windows:
+                    break
+                window, buffers, chunk, dataset_mask = item
+                pending[executor.submit(predict_buffers, buffers, chunk, dataset_mask)] = (window, buffers)
+
+                # Keep at most one window per worker in flight
+                if len(pending) >= workers:
+                    write_finished(FIRST_COMPLETED)
+
+            if pending:
+                write_finished(ALL_COMPLETED)
+    finally:
+        # Stop the reader, emptying the queue in case it is blocked on a full queue after an error
+        stop_reading.set()
+        while reader_thread.is_alive():
+            try:
+                read_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        reader_thread.join()
+
+    if reader_errors:
+        raise reader_errors[0]
+
+# Function to split a raster into chunks aligned to the output blocks
+# Each chunk is one row of block_size x block_size blocks, about chunk_size pixels in total
+def chunk_windows(height, width, chunk_size=1000000, block_size=512):
+    blocks_per_chunk = max(1, chunk_size // (block_size * block_size))
+    chunk_width = block_size * blocks_per_chunk
+    windows = []
+    for row in range(0, height, block_size):
+        for col in range(0, width, chunk_width):
+            windows.append(Window(col, row, min(chunk_width, width - col), min(block_size, height - row)))
+    return windows
+
+# Function to open the prediction GeoTIFF for writing, as a tiled and compressed single-band 1-bit mask
+def open_prediction_geotiff(src, output_tif_path, block_size=512, compression='DEFLATE'):
+    # Start from the metadata of the original GeoTIFF (set dtype to uint8 and number of bands to 1)
+    metadata = src.meta.copy()
+    metadata.update({
+        'driver': 'GTiff',
+        'dtype': 'uint8',
+        'count': 1,
+        'tiled': True,
+        'blockxsize': block_size,
+        'blockysize': block_size,
+        'compress': compression.lower(),
+        'nbits': 1,  # Burn (1) / no burn (0) mask stored with 1 bit per pixel
+    })
+    return rio.open(output_tif_path, 'w', **metadata)
+
+# Function to turn a streamed prediction GeoTIFF into a Cloud-Optimized GeoTIFF with overviews
+# The streamed GeoTIFF is removed afterwards, whether or not the conversion succeeded
+def convert_to_cog(temp_tif_path, output_tif_path, block_size=512, compression='DEFLATE'):
+    try:
+        translate_raster(output_tif_path, temp_tif_path, format='COG', creationOptions=[
+            f'COMPRESS={compression}',
+            f'BLOCKSIZE={block_size}',
+            'OVERVIEWS=AUTO',
+            'OVERVIEW_RESAMPLING=NEAREST',  # Keep the overviews a 0 / 1 mask
+        ])
+    finally:
+        os.remove(temp_tif_path)
+
 # Function to find all TIFF files in a directory
 def find_tif_files(directory):
     tif_files = []
@@ -156,73 +393,96 @@ def make_predictions(directory, df_rename):
     return df_predicted
 
 # Main function to process raster files, make predictions, and generate outputs
-def predict_main():
-    base_dir = r"raster"  # Directory containing input raster files
-    output_dir = r"raster_output"  # Directory to store output files
+# With a manifest, rasters whose prediction is up to date for the current model and scaler are skipped
+# workers sets how many chunks are predicted at once, queue_depth how many chunks are read ahead
+# Each chunk is written to the output GeoTIFF as soon as it is predicted, so memory is bounded by the chunk size
+# Returns the burn polygons of each predicted GeoTIFF (by absolute path) so create_polygon can reuse them
+def predict_main(manifest=None,
+                 base_dir=r"raster",  # Directory containing input raster files
+                 output_dir=r"raster_output",  # Directory to store output files
+                 model_path=r"model/Model_LGBM.sav",  # Path of the trained LightGBM model
+                 scaler_path=r"model/min_max_scaler.pkl",  # Path of the MinMaxScaler
+                 workers=1,
+                 queue_depth=2,
+                 chunk_size=1000000,  # Approximate number of pixels predicted at a time
+                 block_size=512,  # Tile size of the output GeoTIFF; chunks are aligned to it
+                 use_dataset_mask=False,  # Take valid pixels from the dataset mask instead of all-zero bands
+                 output_format='COG',  # 'COG' (Cloud-Optimized GeoTIFF with overviews) or 'GTiff' (tiled GeoTIFF)
+                 compression='DEFLATE',  # 'DEFLATE' or 'ZSTD'
+                 backend='booster',  # Inference backend: 'sklearn', 'booster' or 'treelite'
+                 polygonize=True):  # Polygonize the burnt areas of each prediction (not needed for raster area statistics)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)  # Create output directory if it doesn't exist
         
     # Find all TIFF files in the base directory
     tif_files = find_tif_files(base_dir)
 
+    # Identify the model, scaler and output settings so changing any of them invalidates older predictions
+    model_id = None
+    if manifest is not None:
+        model_id = dict(model_identity(model_path, scaler_path), backend=backend, use_dataset_mask=use_dataset_mask,
+                        block_size=block_size, output_format=output_format, compression=compression)
+
+    # Load the model and scaler once for all rasters
+    bundle = load_model_bundle(model_path, scaler_path)
+    model = make_backend(bundle.model, backend, model_path)
+    params = scaling_params(bundle.scaler)
+
+    burns_by_raster = {}
+
     try:
         for tif_file in tif_files:
+            output_tif_path = os.path.join(output_dir, os.path.basename(tif_file).replace('.tif', '_predicted.tif'))
+            if manifest is not None and manifest.is_up_to_date('predict', output_tif_path, [tif_file], model_id):
+                print(f"\nSkipping {tif_file}: prediction is up to date.")
+                continue
+
             try:
                 # Open the TIFF file to read its metadata and data
                 with rio.open(tif_file) as src:
-                    print(f"\nProcessing file: {tif_file}")
-                    print("\nMetadata:")
-                    for key, value in src.meta.items():
-                        print(f"{key}: {value}")
-                    
                     # Get image dimensions and number of bands
                     height, width = src.shape
                     n_bands = src.count
+                    tile = tile_name(tif_file)
                     
-                    print(f"Image dimensions: {width}x{height}")
-                    print(f"Number of bands: {n_bands}")
-                    
-                    # Load the MinMaxScaler for normalization
-                    scaler_path = r"model/min_max_scaler.pkl"
-                    with open(scaler_path, 'rb') as f:
-                        scaler = pickle.load(f)
-                    
-                    # Load the trained LightGBM model
-                    model_path = r"model/Model_LGBM.sav"
-                    with open(model_path, 'rb') as f:
-                        model = pickle.load(f)
-                    
-                    # Set chunk size for processing large raster files in parts
-                    chunk_size = 1000000
-                    predictions = np.zeros((height, width), dtype=np.uint8)
-                    
-                    # Process raster in chunks to predict burnt areas
-                    for row in range(0, height, chunk_size // width):
-                        row_end = min(row + chunk_size // width, height)
-                        
-                        # Read a chunk of the raster data
-                        chunk = src.read(window=((row, row_end), (0, width)))
-                        
-                        # Convert the chunk to a DataFrame and preprocess it
-                        chunk_df = pd.DataFrame(chunk.reshape([n_bands, -1]).T, columns=[f"band_{i+1}" for i in range(n_bands)])
-                        chunk_preprocessed = preprocess_chunk(chunk_df, scaler)
-                        
-                        # Make predictions for the current chunk
-                        chunk_predictions = make_predictions_chunk(model, chunk_preprocessed)
-                        
-                        # Store predictions in the appropriate part of the result array
-                        predictions[row:row_end, :] = chunk_predictions.reshape((row_end - row, width))
-                    
-                    print("Predictions shape:", predictions.shape)
+                    print(f"\nProcessing file: {tif_file} ({width}x{height}, {n_bands} bands, {src.dtypes[0]}, {src.crs})")
                     
+                    # Split the raster into block-aligned chunks
+                    windows = chunk_windows(height, width, chunk_size, block_size)
+
+                    # Process raster in chunks to predict burnt areas, writing each chunk as it is done
+                    # (to a temporary tiled GeoTIFF first for COG outputs, since COGs cannot be written block by block)
+                    stream_tif_path = output_tif_path + '.tmp.tif' if output_format == 'COG' else output_tif_path
+                    with open_prediction_geotiff(src, stream_tif_path, block_size, compression) as dst:
+                        def write_window(window, chunk_predictions):
+                            with timed('write', tile, pixels=chunk_predictions.size):
+                                dst.write(chunk_predictions, 1, window=window)
+
+                        with timed('predict_tile', tile, pixels=height * width):
+                            predict_windows(src, windows, model, params, write_window, workers, queue_depth, use_dataset_mask, tile)
+
+                    if output_format == 'COG':
+                        with timed('write_cog', tile, pixels=height * width):
+                            convert_to_cog(stream_tif_path, output_tif_path, block_size, compression)
+
+                    print(f"New GeoTIFF file '{output_tif_path}' has been created.")
+
+                # Read the finished prediction back and polygonize the burnt areas once
+                if polygonize:
+                    with rio.open(output_tif_path) as dst:
+                        predictions = dst.read(1)
+                        print("Predictions shape:", predictions.shape)
+                        burns = vectorize_burns(predictions, dst.transform, dst.crs, dst.bounds, fire_date_from_filename(tif_file), tile)
+                    burns_by_raster[os.path.abspath(output_tif_path)] = burns
+
                     # Process the predictions to generate a GeoDataFrame
-                    result_df = process_predictions(predictions, tif_file)
-                    
-                    print(f"Processing completed for {tif_file}")
+                    result_df = process_predictions(predictions, tif_file, burns=burns)
 
-                    # Create a new GeoTIFF file with the predictions
-                    output_tif_path = os.path.join(output_dir, os.path.basename(tif_file).replace('.tif', '_predicted.tif'))
-                    create_geotiff_from_predictions(predictions, tif_file, output_tif_path)
+                print(f"Processing completed for {tif_file}")
+
+                # Remember the prediction for the next run
+                if manifest is not None:
+                    manifest.record('predict', output_tif_path, [tif_file], model_id)
 
             except Exception as e:
                 print(f"An error occurred while processing file {tif_file}: {e}")
@@ -230,6 +490,10 @@ def predict_main():
     finally:
         print("Success Prediction Process.")
 
+    return burns_by_raster
+
 # Run the main function when the script is executed
 if __name__ == "__main__":
+    # Set up logging configuration for debugging
+    logging.basicConfig(level=logging.INFO)
     predict_main()
\ No newline at end of file
@@ -0,0 +1,254 @@
+import os # For checking that requested rasters are inside the served folder
+import json # For the request and response bodies
+import time # For the batching delay
+import queue # For the queue of feature arrays waiting to be predicted
+import threading # For the batching thread
+import logging # For the request log
+import numpy as np # For the pixel and prediction arrays
+import rasterio as rio # For reading the requested tiles and windows
+from rasterio.coords import BoundingBox # For the bounds of a requested window
+from rasterio.windows import Window, from_bounds # For the requested part of a tile
+from rasterio.errors import WindowError # For requested windows outside the tile
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler # For serving one request per thread
+from burn_polygons import vectorize_burns, fire_date_from_filename # For the burn polygons, areas and centroids
+from model_loader import load_model_bundle # For loading the model and scaler once, when the service starts
+from inference_engine import make_backend # For running the model with the chosen backend
+from predict_module import scaling_params, preprocess_array, valid_pixel_mask, predict_array, chunk_windows
+
+logger = logging.getLogger(__name__)
+
+# Feature array of one request waiting in the batch queue, with its result once predicted
+class BatchItem:
+    def __init__(self, features):
+        self.features = features
+        self.predictions = None
+        self.error = None
+        self.done = threading.Event()
+
+# Thread that gathers the feature arrays of concurrent requests and predicts them in one model call
+# A batch is sent when it reaches max_batch_pixels or max_wait seconds after its first array arrived
+class PredictionBatcher:
+    def __init__(self, model, max_batch_pixels=4000000, max_wait=0.01, num_threads=None):
+        self.model = model
+        self.max_batch_pixels = max_batch_pixels
+        self.max_wait = max_wait
+        self.num_threads = num_threads
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.pixels = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Function called from the request threads: blocks until the features are predicted
+    def predict(self, features):
+        item = BatchItem(features)
+        self.requests.put(item)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.predictions
+
+    def stop(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    # Function to take the arrays of the next batch, waiting at most max_wait after the first one
+    def next_batch(self):
+        first = self.requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        n_pixels = len(first.features)
+        deadline = time.monotonic() + self.max_wait
+        while n_pixels < self.max_batch_pixels:
+            try:
+                item = self.requests.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                self.requests.put(None)  # Stop after this batch
+                break
+            batch.append(item)
+            n_pixels += len(item.features)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                break
+            try:
+                features = batch[0].features if len(batch) == 1 else np.concatenate([item.features for item in batch])
+                predictions = predict_array(self.model, features, self.num_threads)
+                start = 0
+                for item in batch:
+                    item.predictions = predictions[start:start + len(item.features)]
+                    start += len(item.features)
+                self.batches += 1
+                self.pixels += len(features)
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+            finally:
+                for item in batch:
+                    item.done.set()
+
+# Function to get the window of a tile asked for in a request: the whole tile by default,
+# "window": [col_off, row_off, width, height] in pixels, or "bounds": [left, bottom, right, top] in the raster CRS
+def request_window(src, request):
+    full_window = Window(0, 0, src.width, src.height)
+    if 'window' in request:
+        window = Window(*request['window'])
+    elif 'bounds' in request:
+        window = from_bounds(*request['bounds'], transform=src.transform).round_offsets().round_lengths()
+    else:
+        return full_window
+    try:
+        window = window.intersection(full_window)
+    except WindowError:
+        raise ValueError("The requested window is outside the raster")
+    if window.width <= 0 or window.height <= 0:
+        raise ValueError("The requested window is outside the raster")
+    return Window(int(window.col_off), int(window.row_off), int(window.width), int(window.height))
+
+# Resident prediction service: the model, scaler and libraries are loaded once and kept warm,
+# and the pixels of every request are predicted through the shared PredictionBatcher
+class PredictionService:
+    def __init__(self, raster_dir=r"raster", model_path=r"model/Model_LGBM.sav", scaler_path=r"model/min_max_scaler.pkl",
+                 backend='booster', chunk_size=1000000, block_size=512, max_batch_pixels=4000000, max_wait=0.01):
+        self.raster_dir = os.path.realpath(raster_dir)
+        self.chunk_size = chunk_size
+        self.block_size = block_size
+        bundle = load_model_bundle(model_path, scaler_path)
+        self.params = scaling_params(bundle.scaler)
+        self.batcher = PredictionBatcher(make_backend(bundle.model, backend, model_path), max_batch_pixels, max_wait)
+        self.model_path = model_path
+        self.backend = backend
+
+    # Function to resolve a requested raster path, which has to be inside the served folder
+    def raster_path(self, path):
+        full_path = os.path.realpath(os.path.join(self.raster_dir, path))
+        if os.path.commonpath([full_path, self.raster_dir]) != self.raster_dir:
+            raise PermissionError(f"'{path}' is outside the served folder")
+        if not os.path.isfile(full_path):
+            raise FileNotFoundError(f"'{path}' does not exist")
+        return full_path
+
+    # Function to predict the burn mask of a window, chunk by chunk, with the valid pixels of each chunk batched
+    def predict_window(self, src, window):
+        predictions = np.zeros((window.height, window.width), dtype=np.uint8)
+        for chunk_window in chunk_windows(window.height, window.width, self.chunk_size, self.block_size):
+            rows = slice(chunk_window.row_off, chunk_window.row_off + chunk_window.height)
+            cols = slice(chunk_window.col_off, chunk_window.col_off + chunk_window.width)
+            read_window = Window(window.col_off + chunk_window.col_off, window.row_off + chunk_window.row_off,
+                                 chunk_window.width, chunk_window.height)
+            bands = src.read(window=read_window).reshape([src.count, -1])
+            valid = valid_pixel_mask(bands)
+            n_valid = np.count_nonzero(valid)
+            if n_valid == 0:
+                continue
+            features = preprocess_array(bands[:, valid] if n_valid < valid.size else bands, self.params)
+            chunk_predictions = np.zeros(valid.size, dtype=np.uint8)
+            chunk_predictions[valid] = self.batcher.predict(features)
+            predictions[rows, cols] = chunk_predictions.reshape((chunk_window.height, chunk_window.width))
+        return predictions
+
+    # Function to answer a prediction request: burn pixels, areas and (optionally) the polygons as WGS84 GeoJSON
+    def predict(self, request):
+        if 'path' not in request:
+            raise ValueError("The request needs the 'path' of a stacked raster")
+        raster_path = self.raster_path(request['path'])
+        try:
+            fire_date = fire_date_from_filename(raster_path)
+        except (IndexError, ValueError):
+            fire_date = None
+
+        start_time = time.perf_counter()
+        with rio.open(raster_path) as src:
+            window = request_window(src, request)
+            predictions = self.predict_window(src, window)
+            transform = src.window_transform(window)
+            bounds = BoundingBox(*src.window_bounds(window))
+            crs = src.crs
+        burns = vectorize_burns(predictions, transform, crs, bounds, fire_date)
+
+        response = {
+            'path': request['path'],
+            'window': [window.col_off, window.row_off, window.width, window.height],
+            'fire_date': fire_date,
+            'burn_pixels': int(np.count_nonzero(predictions == 1)),
+            'regions': len(burns),
+            'total_area_m2': float(burns['area_m2'].sum()),
+            'seconds': time.perf_counter() - start_time,
+        }
+        if request.get('geojson', True):
+            polygons = burns[['geometry', 'area_m2', 'LATITUDE', 'LONGITUDE', 'FIRE_DATE']].to_crs("EPSG:4326")
+            response['geojson'] = json.loads(polygons.to_json())
+        return response
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'model': self.model_path,
+            'backend': self.backend,
+            'batches': self.batcher.batches,
+            'pixels': self.batcher.pixels,
+        }
+
+# HTTP interface of the service: GET /health, and POST /predict with a JSON body such as
+# {"path": "T47QNB_20230228.tif", "bounds": [left, bottom, right, top], "geojson": true}
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, self.server.service.health())
+        else:
+            self.send_json(404, {'error': f"Unknown path '{self.path}'"})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self.send_json(404, {'error': f"Unknown path '{self.path}'"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            self.send_json(200, self.server.service.predict(request))
+        except (ValueError, TypeError, KeyError) as e:
+            self.send_json(400, {'error': str(e)})
+        except PermissionError as e:
+            self.send_json(403, {'error': str(e)})
+        except FileNotFoundError as e:
+            self.send_json(404, {'error': str(e)})
+        except Exception as e:
+            logger.error(f"An error occurred while answering {self.path}: {e}")
+            self.send_json(500, {'error': str(e)})
+
+    def log_message(self, format, *args):
+        logger.info(format % args)
+
+# Function to run the service until it is interrupted (Ctrl+C)
+# Binds to localhost by default: the service reads any raster under raster_dir for whoever can reach it
+def serve(host='127.0.0.1', port=8765, **service_options):
+    service = PredictionService(**service_options)
+    server = ThreadingHTTPServer((host, port), PredictionRequestHandler)
+    server.service = service
+    print(f"Prediction service listening on http://{host}:{port} (POST /predict, GET /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.batcher.stop()
+        print("Prediction service stopped.")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve()
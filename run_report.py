@@ -0,0 +1,117 @@
+import os # For creating the report folder
+import sys # For the platform-specific units of ru_maxrss
+import json # For writing the run report
+import time # For the stage timers and the run wall time
+import threading # For recording timings from several threads safely
+from contextlib import contextmanager # For timing a block of code with a with statement
+from datetime import datetime # For the start time of the run
+
+# Function to get the peak resident set size (in bytes) of this process and of its finished child processes
+def peak_rss():
+    try:
+        import resource # Unix only
+        scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS, in kilobytes on Linux
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+        return own, children
+    except ImportError:
+        try:
+            import psutil # Windows
+            return psutil.Process().memory_info().peak_wset, None
+        except (ImportError, AttributeError):
+            return None, None
+
+# Timings and throughput of a pipeline run, aggregated per stage and per tile
+class RunReport:
+    def __init__(self):
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.start_time = time.perf_counter()
+        self.entries = {}  # (stage, tile) -> calls, seconds, pixels, polygons
+        self.lock = threading.Lock()
+
+    # Function to add one timing (or the aggregated timings of another report) to a stage / tile
+    def add(self, stage, tile, seconds, pixels=0, polygons=0, calls=1):
+        with self.lock:
+            entry = self.entries.setdefault((stage, tile), {'calls': 0, 'seconds': 0.0, 'pixels': 0, 'polygons': 0})
+            entry['calls'] += calls
+            entry['seconds'] += seconds
+            entry['pixels'] += int(pixels)
+            entry['polygons'] += int(polygons)
+
+    # Function to merge the entries of a report made in a worker process
+    def merge(self, entries):
+        for (stage, tile), entry in entries.items():
+            self.add(stage, tile, entry['seconds'], entry['pixels'], entry['polygons'], entry['calls'])
+
+    # Function to build the JSON-ready report: totals per stage, entries per tile, wall time and peak memory
+    def to_dict(self):
+        stages = {}
+        tiles = []
+        with self.lock:
+            for (stage, tile), entry in sorted(self.entries.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+                total = stages.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'pixels': 0, 'polygons': 0})
+                for key in total:
+                    total[key] += entry[key]
+                tiles.append(dict(stage=stage, tile=tile, **entry))
+
+        # Throughput of each stage
+        for total in stages.values():
+            seconds = total['seconds']
+            total['pixels_per_second'] = total['pixels'] / seconds if seconds and total['pixels'] else None
+            total['polygons_per_second'] = total['polygons'] / seconds if seconds and total['polygons'] else None
+
+        own_rss, children_rss = peak_rss()
+        return {
+            'started_at': self.started_at,
+            'wall_time_seconds': time.perf_counter() - self.start_time,
+            'peak_rss_bytes': own_rss,
+            'peak_rss_children_bytes': children_rss,
+            'stages': stages,
+            'tiles': tiles,
+        }
+
+    # Function to write the report as JSON and print the per-stage summary
+    def write(self, report_path):
+        report = self.to_dict()
+        report_folder = os.path.dirname(report_path)
+        if report_folder:
+            os.makedirs(report_folder, exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        print("\nStage timings:")
+        for stage, total in report['stages'].items():
+            line = f"{stage}: {total['seconds']:.2f}s in {total['calls']} calls"
+            if total['pixels_per_second']:
+                line += f", {total['pixels_per_second']:,.0f} pixels/s"
+            if total['polygons_per_second']:
+                line += f", {total['polygons_per_second']:,.0f} polygons/s"
+            print(line)
+        if report['peak_rss_bytes']:
+            print(f"Peak RSS: {report['peak_rss_bytes'] / 1024 ** 2:.0f} MB")
+        print(f"Run report saved to {report_path}")
+        return report
+
+# Report of the current run, shared by all modules of the pipeline
+active_report = RunReport()
+
+# Function to get the name a raster is reported under (e.g. T47QNB_20230228 for T47QNB_20230228_predicted.tif)
+def tile_name(path):
+    return os.path.splitext(os.path.basename(path))[0].replace('_predicted', '')
+
+# Function to start a new report (at the start of a run, or of a task in a worker process)
+def reset_report():
+    global active_report
+    active_report = RunReport()
+    return active_report
+
+# Function to time a block of code as a stage of a tile
+# The yielded dict can be updated with the pixels / polygons processed, e.g. counts['polygons'] = len(burns)
+@contextmanager
+def timed(stage, tile=None, pixels=0, polygons=0):
+    counts = {'pixels': pixels, 'polygons': polygons}
+    start_time = time.perf_counter()
+    try:
+        yield counts
+    finally:
+        active_report.add(stage, tile, time.perf_counter() - start_time, counts['pixels'], counts['polygons'])
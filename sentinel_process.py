@@ -1,10 +1,16 @@
 import os # For handling file paths
+import time # For timing how long each tile takes
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor # For processing tiles and bands in parallel
 import rasterio  # For reading and writing raster files
 from rasterio.enums import Resampling  # For specifying the resampling method
+from rasterio.vrt import WarpedVRT  # For resampling on the fly, window by window
 from osgeo import gdal  # GDAL library for handling raster data
+import run_report  # For the per-stage and per-tile timings of the run report
+from run_report import timed  # For timing the resample and stack stages
 
 # Function to resample a single image to a target resolution
-def resample_image(input_path, output_path, target_resolution=10):
+# The output is written block by block, so memory stays flat whatever the tile size
+def resample_image(input_path, output_path, target_resolution=10, block_size=512):
     print(f"Resampling image: {input_path} to {output_path} at {target_resolution}m resolution.")
     
     # Open the input raster file
@@ -12,40 +18,130 @@ def resample_image(input_path, output_path, target_resolution=10):
         # Calculate the scale factor based on the target resolution
         scale_factor = src.res[0] / target_resolution
         
-        # Read and resample the raster data
-        data = src.read(
-            out_shape=(
-                src.count,  # Number of bands
-                int(src.height * scale_factor),  # Adjusted height
-                int(src.width * scale_factor)  # Adjusted width
-            ),
-            resampling=Resampling.bilinear  # Bilinear resampling for smooth resizing
-        )
+        # Size of the resampled raster
+        height = int(src.height * scale_factor)  # Adjusted height
+        width = int(src.width * scale_factor)  # Adjusted width
         
         # Adjust the transformation matrix to match the new resolution
         transform = src.transform * src.transform.scale(
-            (src.width / data.shape[-1]),  # Adjust width scaling
-            (src.height / data.shape[-2])  # Adjust height scaling
+            (src.width / width),  # Adjust width scaling
+            (src.height / height)  # Adjust height scaling
         )
         
-        # Write the resampled data to a new file
-        with rasterio.open(
-            output_path,
-            'w',
-            driver='GTiff',  # Save as GeoTIFF
-            height=data.shape[1],  # Set new height
-            width=data.shape[2],  # Set new width
-            count=src.count,  # Number of bands
-            dtype=data.dtype,  # Data type (e.g., uint16)
-            crs=src.crs,  # Coordinate reference system (CRS)
-            transform=transform,  # New transform matrix
-        ) as dst:
-            dst.write(data)  # Write the resampled data
+        # A warped VRT on the target grid resamples only the windows that are read from it
+        tile = os.path.basename(os.path.dirname(os.path.abspath(input_path)))
+        with timed('resample', tile, pixels=height * width), WarpedVRT(
+            src,
+            crs=src.crs,
+            transform=transform,
+            height=height,
+            width=width,
+            resampling=Resampling.bilinear  # Bilinear resampling for smooth resizing
+        ) as vrt:
+            # Write the resampled data to a new tiled file, one output block at a time
+            with rasterio.open(
+                output_path,
+                'w',
+                driver='GTiff',  # Save as GeoTIFF
+                height=height,  # Set new height
+                width=width,  # Set new width
+                count=src.count,  # Number of bands
+                dtype=src.dtypes[0],  # Data type (e.g., uint16)
+                crs=src.crs,  # Coordinate reference system (CRS)
+                transform=transform,  # New transform matrix
+                tiled=True,  # Internal tiles so the windows below match the file blocks
+                blockxsize=block_size,
+                blockysize=block_size,
+            ) as dst:
+                for _, window in dst.block_windows(1):
+                    dst.write(vrt.read(window=window), window=window)  # Write the resampled block
     
     print(f"Resampling completed: {output_path}")
 
+# Bands stacked into the output raster, in the order expected by the model
+ordered_bands = ['B03', 'B04', 'B05', 'B06', 'B07', 'B08', 'B8A', 'B09', 'B12']
+
+# Function to find which band a .jp2 file name belongs to (None if not a stacked band)
+def match_band(jp2_file):
+    for band in ordered_bands:
+        if band in jp2_file:
+            return band
+    return None
+
+# Function to get the gdal.Translate options for writing a band stack
+# 'COG' writes a Cloud-Optimized GeoTIFF (internal tiles, horizontal predictor, DEFLATE or ZSTD
+# compression and overviews), 'GTiff' a plain striped, uncompressed GeoTIFF
+def stack_translate_options(output_format='COG', compression='DEFLATE', block_size=512):
+    if output_format == 'GTiff':
+        return {}
+    if output_format == 'COG':
+        return {
+            'format': 'COG',
+            'creationOptions': [
+                f'COMPRESS={compression}',
+                'PREDICTOR=YES',  # Horizontal differencing, suited to the uint16 reflectances
+                f'BLOCKSIZE={block_size}',
+                'OVERVIEWS=AUTO',
+                'BIGTIFF=IF_SAFER',
+                'NUM_THREADS=ALL_CPUS',
+            ],
+        }
+    raise ValueError(f"Unknown output format: {output_format}")
+
+# Function to run gdal.Translate into a temporary file next to output_path, and move it into place once complete
+# Without gdal.UseExceptions, gdal.Translate returns None on failure instead of raising, so that is raised here
+# (an older output at output_path is left untouched, so it is never mistaken for the new one)
+def translate_raster(output_path, source, **options):
+    root, extension = os.path.splitext(output_path)
+    temp_path = f"{root}.tmp{extension}"
+    dataset = gdal.Translate(temp_path, source, **options)
+    if dataset is None:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise RuntimeError(f"gdal.Translate could not write {output_path}: {gdal.GetLastErrorMsg()}")
+    dataset = None  # Close the dataset so it is completely written before it is moved into place
+    os.replace(temp_path, output_path)
+
+# Function to build the resampled multi-band stack straight from the JP2 sources
+def build_band_stack(band_paths, output_path, target_resolution=10, band_workers=None, output_format='COG', compression='DEFLATE'):
+    print(f"Building {target_resolution}m band stack directly from JP2 sources to {output_path}.")
+
+    # Number of GDAL decode threads (e.g. for JPEG2000) for this stack only; without band_workers,
+    # GDAL's own default is kept (the JP2OpenJPEG driver already decodes with all cores)
+    thread_options = {'GDAL_NUM_THREADS': str(band_workers)} if band_workers else {}
+
+    # Source files in the model's band order
+    source_files = [band_paths[band] for band in ordered_bands if band in band_paths]
+
+    # A VRT with a user resolution resamples every band on the fly while it is read,
+    # so the bands are decoded once and written once with no intermediate GeoTIFFs
+    vrt = gdal.BuildVRT(
+        '',
+        source_files,
+        separate=True,  # One output band per source file
+        resolution='user',
+        xRes=target_resolution,
+        yRes=target_resolution,
+        resampleAlg='bilinear'  # Same bilinear resampling as resample_image
+    )
+    with timed('stack', os.path.splitext(os.path.basename(output_path))[0], pixels=vrt.RasterXSize * vrt.RasterYSize):
+        with gdal.config_options(thread_options):
+            translate_raster(output_path, vrt, **stack_translate_options(output_format, compression))
+
+    # Close the in-memory VRT
+    del vrt
+
+# Function to get the output path of the band stack of a tile folder (named after the folder)
+def stack_output_path(input_folder, output_folder):
+    output_filename = os.path.basename(input_folder) + '.tif'
+    return os.path.join(output_folder, output_filename)
+
 # Function to process multiple band files in a folder
-def process_bands(input_folder, output_folder):
+# ingest_mode='fused' stacks the bands in a single pass, 'resample' keeps the per-band temp GeoTIFFs
+# band_workers sets the GDAL decode threads of the tile in fused mode (GDAL's default if None),
+# and how many bands are resampled at once in resample mode (one if None)
+# output_format / compression select how the stack is written (see stack_translate_options)
+def process_bands(input_folder, output_folder, ingest_mode='fused', band_workers=None, output_format='COG', compression='DEFLATE'):
     print(f"Processing bands in folder: {input_folder}")
     
     # Find all .jp2 files in the input folder
@@ -56,6 +152,29 @@ def process_bands(input_folder, output_folder):
         print("No JP2 files found in the input folder.")
         return
 
+    # Create the output filename based on the input folder name
+    output_path = stack_output_path(input_folder, output_folder)
+
+    if ingest_mode == 'fused':
+        # Store paths of specific bands (B03, B04, etc.) based on file names
+        band_paths = {}
+        for jp2_file in jp2_files:
+            band = match_band(jp2_file)
+            if band is not None:
+                band_paths[band] = os.path.join(input_folder, jp2_file)
+
+        build_band_stack(band_paths, output_path, band_workers=band_workers, output_format=output_format, compression=compression)
+    elif ingest_mode == 'resample':
+        process_bands_resampled(input_folder, jp2_files, output_folder, output_path, band_workers, output_format, compression)
+    else:
+        raise ValueError(f"Unknown ingest mode: {ingest_mode}")
+
+    # Check the CRS of the output raster
+    with rasterio.open(output_path) as dst:
+        print("Output raster CRS:", dst.crs)
+
+# Function to resample every band to a temporary GeoTIFF and then merge them
+def process_bands_resampled(input_folder, jp2_files, output_folder, output_path, band_workers=None, output_format='COG', compression='DEFLATE'):
     # Create a temporary folder for resampled files
     temp_folder = os.path.join(output_folder, 'temp')
     os.makedirs(temp_folder, exist_ok=True)
@@ -63,51 +182,34 @@ def process_bands(input_folder, output_folder):
     resampled_files = []  # List to store paths of resampled files
     band_paths = {}  # Dictionary to hold paths for specific bands
 
-    # Resample all images to 10m resolution
-    for jp2_file in jp2_files:
-        input_path = os.path.join(input_folder, jp2_file)
-        output_path = os.path.join(temp_folder, f"{os.path.splitext(jp2_file)[0]}_resampled.tif")
-        
-        # Resample the image
-        resample_image(input_path, output_path)
-        resampled_files.append(output_path)
+    # Resample all images to 10m resolution, several bands at a time
+    with ThreadPoolExecutor(max_workers=band_workers or 1) as executor:
+        futures = []
+        for jp2_file in jp2_files:
+            input_path = os.path.join(input_folder, jp2_file)
+            temp_path = os.path.join(temp_folder, f"{os.path.splitext(jp2_file)[0]}_resampled.tif")
+            
+            # Resample the image
+            futures.append(executor.submit(resample_image, input_path, temp_path))
+            resampled_files.append(temp_path)
 
-        # Store paths of specific bands (B03, B04, etc.) based on file names
-        if 'B03' in jp2_file:
-            band_paths['B03'] = output_path
-        elif 'B04' in jp2_file:
-            band_paths['B04'] = output_path
-        elif 'B05' in jp2_file:
-            band_paths['B05'] = output_path
-        elif 'B06' in jp2_file:
-            band_paths['B06'] = output_path
-        elif 'B07' in jp2_file:
-            band_paths['B07'] = output_path
-        elif 'B08' in jp2_file:
-            band_paths['B08'] = output_path
-        elif 'B8A' in jp2_file:
-            band_paths['B8A'] = output_path
-        elif 'B09' in jp2_file:
-            band_paths['B09'] = output_path
-        elif 'B12' in jp2_file:
-            band_paths['B12'] = output_path
+            # Store paths of specific bands (B03, B04, etc.) based on file names
+            band = match_band(jp2_file)
+            if band is not None:
+                band_paths[band] = temp_path
+
+        # Wait for every band and re-raise the first resampling error
+        for future in futures:
+            future.result()
 
     # Ensure all required bands are found
-    ordered_bands = ['B03', 'B04', 'B05', 'B06', 'B07', 'B08', 'B8A', 'B09', 'B12']
     final_resampled_files = [band_paths[band] for band in ordered_bands if band in band_paths]
 
-    # Create the output filename based on the input folder name
-    output_filename = os.path.basename(input_folder) + '.tif'
-    output_path = os.path.join(output_folder, output_filename)
-    
     # Combine the resampled bands into a single multi-band GeoTIFF
     print(f"Building VRT for resampled files and translating to {output_path}.")
     vrt = gdal.BuildVRT('', final_resampled_files, separate=True)
-    gdal.Translate(output_path, vrt)
-
-    # Check the CRS of the output raster
-    with rasterio.open(output_path) as dst:
-        print("Output raster CRS:", dst.crs)
+    with timed('stack', os.path.splitext(os.path.basename(output_path))[0], pixels=vrt.RasterXSize * vrt.RasterYSize):
+        translate_raster(output_path, vrt, **stack_translate_options(output_format, compression))
 
     # Clean up the temporary VRT file
     del vrt
@@ -118,26 +220,95 @@ def process_bands(input_folder, output_folder):
         os.remove(file)
     os.rmdir(temp_folder)
 
+# Function to process one tile folder and time it
+# Errors are returned instead of raised so one bad tile does not stop the others
+# In a worker process (collect_report=True) the tile's timings are returned for the run report of the parent
+def process_tile(dirpath, output_folder, ingest_mode='fused', band_workers=None, collect_report=False, output_format='COG', compression='DEFLATE'):
+    if collect_report:
+        run_report.reset_report()
+
+    start_time = time.perf_counter()
+    try:
+        with timed('ingest', os.path.basename(dirpath)):
+            process_bands(dirpath, output_folder, ingest_mode, band_workers, output_format, compression)
+        error = None
+    except Exception as e:
+        error = str(e)
+
+    report_entries = run_report.active_report.entries if collect_report else None
+    return dirpath, time.perf_counter() - start_time, error, report_entries
+
+# Function to wait for the result of a tile processed in the pool
+# A worker that dies (e.g. killed for running out of memory) breaks the pool: its tile and the tiles still
+# queued fail with BrokenProcessPool, which is returned as their error like any other tile error
+def tile_result(future, dirpath, start_time):
+    try:
+        return future.result()
+    except Exception as e:
+        return dirpath, time.perf_counter() - start_time, f"{type(e).__name__}: {e}", None
+
 # Function to search for folders containing .jp2 files and process them
-def find_and_process_folders(root_folder, output_folder):
+# workers sets how many tile folders are processed at the same time (one process each)
+# With a manifest, tiles whose band stack is already up to date are skipped
+def find_and_process_folders(root_folder, output_folder, workers=1, band_workers=None, ingest_mode='fused', manifest=None,
+                             output_format='COG', compression='DEFLATE'):
     print(f"Searching for folders in: {root_folder}")
+    start_time = time.perf_counter()
+
+    # Settings that change the band stack, so changing them invalidates older stacks
+    settings = {'ingest_mode': ingest_mode, 'output_format': output_format, 'compression': compression}
     
     # Walk through all directories and subdirectories
+    tiles = []
     for dirpath, dirnames, filenames in os.walk(root_folder):
         # If any .jp2 files are found in the directory, process the folder
         if any(f.endswith('.jp2') for f in filenames):
             relative_path = os.path.relpath(dirpath, root_folder)  # Get the relative folder path
             current_output_folder = os.path.join(output_folder, relative_path)  # Set output folder path
+
+            # Skip tiles that were already processed from the same JP2 files
+            jp2_paths = [os.path.join(dirpath, f) for f in filenames if f.endswith('.jp2')]
+            if manifest is not None and manifest.is_up_to_date('ingest', stack_output_path(dirpath, current_output_folder), jp2_paths, settings):
+                print(f"Skipping {dirpath}: band stack is up to date.")
+                continue
+
             os.makedirs(current_output_folder, exist_ok=True)
             print(f"Found JP2 files in: {dirpath}. Processing...")
-            process_bands(dirpath, current_output_folder)
+            tiles.append((dirpath, current_output_folder))
+
+    # Process the tiles one by one, or in a pool of worker processes
+    if workers > 1 and len(tiles) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(process_tile, dirpath, folder, ingest_mode, band_workers, True, output_format, compression) for dirpath, folder in tiles]
+            results = [tile_result(future, dirpath, start_time) for future, (dirpath, _) in zip(futures, tiles)]
+    else:
+        results = [process_tile(dirpath, folder, ingest_mode, band_workers, False, output_format, compression) for dirpath, folder in tiles]
+
+    # Add the timings of the worker processes to the run report
+    for _, _, _, report_entries in results:
+        if report_entries is not None:
+            run_report.active_report.merge(report_entries)
+    results = [(dirpath, elapsed, error) for dirpath, elapsed, error, _ in results]
+
+    # Print a summary of the wall time for each tile
+    print("\nTile processing summary:")
+    for (dirpath, elapsed, error), (_, folder) in zip(results, tiles):
+        status = "OK" if error is None else f"FAILED ({error})"
+        print(f"{dirpath}: {elapsed:.1f}s {status}")
+
+        # Remember successfully processed tiles for the next run
+        if manifest is not None and error is None:
+            jp2_paths = [os.path.join(dirpath, f) for f in os.listdir(dirpath) if f.endswith('.jp2')]
+            manifest.record('ingest', stack_output_path(dirpath, folder), jp2_paths, settings)
+    print(f"Total wall time: {time.perf_counter() - start_time:.1f}s")
     
     print("All folders processed.")
+    return results
 
-# Usage Example
-root_folder = r'sentinel-2 Image'  # Set this to the folder containing Sentinel-2 .jp2 images
-output_folder = r'raster'  # Set this to the folder where output files will be saved
-
-# Run the folder processing function
-find_and_process_folders(root_folder, output_folder)
+if __name__ == "__main__":
+    # Usage Example
+    root_folder = r'sentinel-2 Image'  # Set this to the folder containing Sentinel-2 .jp2 images
+    output_folder = r'raster'  # Set this to the folder where output files will be saved
 
+    # Run the folder processing function
+    find_and_process_folders(root_folder, output_folder)
@@ -0,0 +1,41 @@
+import pytest # For the test parametrization
+
+# The pipeline's dependencies; the tests are skipped where they are not installed
+np = pytest.importorskip('numpy')
+ndimage = pytest.importorskip('scipy.ndimage')
+pytest.importorskip('rasterio')
+
+from block_label import block_label, region_stats
+
+# Random masks with regions of many shapes and sizes: a low density gives small separate regions,
+# a density near the percolation threshold gives large regions winding across many strip seams
+@pytest.fixture(params=[(0, 0.1), (1, 0.45), (2, 0.6), (3, 0.9)], ids=['sparse', 'winding', 'dense', 'full'])
+def mask(request):
+    seed, density = request.param
+    rng = np.random.default_rng(seed)
+    return rng.random((203, 157)) < density
+
+# Strips of one row, of a few rows, not dividing the height, and of the whole mask
+@pytest.mark.parametrize('block_rows', [1, 2, 16, 50, 203, 1000])
+def test_block_label_matches_scipy(mask, block_rows):
+    expected, expected_count = ndimage.label(mask)
+    labels, count = block_label(mask, block_rows, workers=4)
+    assert count == expected_count
+    np.testing.assert_array_equal(labels, expected)
+
+@pytest.mark.parametrize('block_rows', [1, 7, 64])
+def test_region_stats_match_scipy(mask, block_rows):
+    expected, expected_count = ndimage.label(mask)
+    burnt_pixels = np.flatnonzero(expected)
+    region_labels = expected.ravel()[burnt_pixels]
+    rows, cols = np.divmod(burnt_pixels, mask.shape[1])
+
+    pixel_counts, row_sums, col_sums = region_stats(lambda row, n_rows: mask[row:row + n_rows], mask.shape[0], block_rows, workers=4)
+    np.testing.assert_array_equal(pixel_counts, np.bincount(region_labels, minlength=expected_count + 1)[1:])
+    np.testing.assert_array_equal(row_sums, np.bincount(region_labels, weights=rows, minlength=expected_count + 1)[1:])
+    np.testing.assert_array_equal(col_sums, np.bincount(region_labels, weights=cols, minlength=expected_count + 1)[1:])
+
+def test_empty_mask():
+    labels, count = block_label(np.zeros((10, 10), dtype=bool), 3)
+    assert count == 0
+    assert not labels.any()
@@ -0,0 +1,84 @@
+import pickle # For saving the stand-in model and scaler like the real ones
+import pytest # For the test fixtures and parametrization
+
+# The pipeline's dependencies; the tests are skipped where they are not installed
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+lightgbm = pytest.importorskip('lightgbm')
+preprocessing = pytest.importorskip('sklearn.preprocessing')
+pytest.importorskip('rasterio')
+pytest.importorskip('geopandas')
+pytest.importorskip('osgeo')
+
+from model_loader import load_model_bundle
+from inference_engine import inference_backends, make_backend
+from predict_module import (expected_column_names, preprocess_chunk, make_predictions_chunk, scaling_params,
+                            preprocess_array, predict_array, predict_chunk, ChunkScratch)
+
+# Typical reflectances (x10000) of unburnt and burnt land for each band of the stack
+unburnt_reflectance = [900, 800, 1300, 2200, 2600, 2800, 2900, 3000, 1500]
+burnt_reflectance = [700, 800, 1000, 1200, 1300, 1300, 1400, 1500, 2400]
+
+# A small model and scaler trained on integer reflectances, like the real model trained on uint16 pixels
+@pytest.fixture(scope='module')
+def stand_in_model(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    n_samples = 20000
+    labels = rng.random(n_samples) < 0.5
+    features = pd.DataFrame({
+        name: np.round(np.where(labels, burnt, unburnt) + rng.normal(0, 300, n_samples)).clip(0, 4095)
+        for name, unburnt, burnt in zip(expected_column_names, unburnt_reflectance, burnt_reflectance)
+    })
+    scaler = preprocessing.MinMaxScaler().fit(features)
+    model = lightgbm.LGBMClassifier(n_estimators=50, num_leaves=31, verbose=-1)
+    model.fit(pd.DataFrame(scaler.transform(features), columns=scaler.feature_names_in_), labels.astype(int))
+
+    folder = tmp_path_factory.mktemp('model')
+    model_path = str(folder / 'Model_LGBM.sav')
+    scaler_path = str(folder / 'min_max_scaler.pkl')
+    with open(model_path, 'wb') as f:
+        pickle.dump(model, f)
+    with open(scaler_path, 'wb') as f:
+        pickle.dump(scaler, f)
+    return load_model_bundle(model_path, scaler_path), model_path
+
+# Band-major test pixels (n_bands x n_pixels) over the whole reflectance range, with some empty pixels
+@pytest.fixture(scope='module')
+def bands():
+    rng = np.random.default_rng(1)
+    bands = rng.integers(0, 4096, size=(9, 50000), dtype=np.uint16)
+    bands[:, ::7] = 0
+    return bands
+
+# The original DataFrame path: preprocess_chunk and make_predictions_chunk
+def dataframe_predictions(bands, bundle):
+    chunk_df = pd.DataFrame(bands.T, columns=[f"band_{i+1}" for i in range(bands.shape[0])])
+    return np.asarray(make_predictions_chunk(bundle.model, preprocess_chunk(chunk_df, bundle.scaler)))
+
+def test_preprocess_array_matches_scaler(stand_in_model, bands):
+    bundle, _ = stand_in_model
+    chunk_df = pd.DataFrame(bands.T, columns=[f"band_{i+1}" for i in range(bands.shape[0])])
+    expected = preprocess_chunk(chunk_df, bundle.scaler).to_numpy()
+    np.testing.assert_allclose(preprocess_array(bands, scaling_params(bundle.scaler)), expected, rtol=1e-6, atol=1e-6)
+
+@pytest.mark.parametrize('backend', sorted(inference_backends))
+def test_backend_matches_dataframe_path(stand_in_model, bands, backend, tmp_path):
+    if backend == 'treelite':
+        pytest.importorskip('treelite')
+        pytest.importorskip('tl2cgen')
+    bundle, model_path = stand_in_model
+    features = preprocess_array(bands, scaling_params(bundle.scaler))
+    predictions = predict_array(make_backend(bundle.model, backend, model_path, str(tmp_path)), features)
+    np.testing.assert_array_equal(np.asarray(predictions), dataframe_predictions(bands, bundle))
+
+def test_predict_chunk_with_buffers_matches_dataframe_path(stand_in_model, bands):
+    bundle, _ = stand_in_model
+    params = scaling_params(bundle.scaler)
+    chunk = bands.reshape((9, 250, 200))
+    expected = dataframe_predictions(bands, bundle)
+    expected[np.all(bands == 0, axis=0)] = 0  # Empty pixels are not predicted
+
+    scratch = ChunkScratch(9, len(params[0]), bands.shape[1], bands.dtype)
+    out = np.empty(bands.shape[1], dtype=np.uint8)
+    np.testing.assert_array_equal(predict_chunk(chunk, bundle.model, params).ravel(), expected)
+    np.testing.assert_array_equal(predict_chunk(chunk, bundle.model, params, scratch=scratch, out=out).ravel(), expected)
@@ -0,0 +1,216 @@
+import os # For the cache and output folder layout
+import shutil # For clearing the strips of a stack that changed
+import json # For the description of each cached date
+import numpy as np # For the cached feature, valid-pixel and prediction arrays
+import rasterio as rio # For reading the stacks and writing the delta masks
+from rasterio.windows import Window # For the strips of rows cached, scaled and predicted at a time
+from burn_polygons import fire_date_from_filename, tile_id_from_filename # For grouping the stacks by tile and date
+from manifest import file_signature, file_hash # For invalidating cached dates when a stack, the scaler or the model changes
+from model_loader import load_model_bundle # For loading the model and scaler once
+from inference_engine import make_backend # For running the model with the chosen backend
+from predict_module import find_tif_files, scaling_params, preprocess_array, valid_pixel_mask, predict_array, open_prediction_geotiff, convert_to_cog
+from run_report import timed # For timing the read, cache, scale, predict and delta stages of each tile
+
+# Function to group the stacks of a folder by tile id, with the dates of each tile in order
+# Returns {tile_id: [(fire_date, stack_path), ...]}
+def group_stacks_by_tile(base_dir):
+    tiles = {}
+    for tif_file in find_tif_files(base_dir):
+        try:
+            fire_date = fire_date_from_filename(tif_file)
+        except (IndexError, ValueError):
+            print(f"Skipping {tif_file}: no date in the file name.")
+            continue
+        tiles.setdefault(tile_id_from_filename(tif_file), []).append((fire_date, tif_file))
+    return {tile_id: sorted(dates) for tile_id, dates in sorted(tiles.items())}
+
+# Cached arrays of one tile and date, in cache_dir/<tile id>/<date>/:
+# bands/strip_<row>.npz - the stack's pixels, one compressed file per strip of rows (band-major, in the stack's
+#                         own dtype, e.g. uint16); they are scaled when loaded, which costs far less than reading the stack
+# valid.npy - valid-pixel mask of the stack (bool, one value per pixel)
+# prediction.npy - predicted burn mask (uint8, height x width)
+# meta.json - the stack the pixels come from, the strip height, and the scaler and model of the prediction
+class DateCache:
+    def __init__(self, cache_dir, tile_id, fire_date, stack_path):
+        self.folder = os.path.join(cache_dir, tile_id, fire_date)
+        self.fire_date = fire_date
+        self.stack_path = stack_path
+        self.bands_folder = os.path.join(self.folder, 'bands')
+        self.valid_path = os.path.join(self.folder, 'valid.npy')
+        self.prediction_path = os.path.join(self.folder, 'prediction.npy')
+        self.meta_path = os.path.join(self.folder, 'meta.json')
+
+        self.meta = {}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+
+    def save_meta(self):
+        temp_path = self.meta_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(temp_path, self.meta_path)
+
+    # Strips of the cached pixels, with the height stored when they were cached
+    def windows(self):
+        height, width = self.meta['shape']
+        return strip_windows(height, width, self.meta['strip_rows'] * width)
+
+    def strip_path(self, window):
+        return os.path.join(self.bands_folder, f"strip_{window.row_off:06d}.npz")
+
+    # The cached pixels are reusable while the stack is unchanged
+    def has_bands(self):
+        return (self.meta.get('stack') == file_signature(self.stack_path) and 'strip_rows' in self.meta and os.path.exists(self.valid_path)
+                and all(os.path.exists(self.strip_path(window)) for window in self.windows()))
+
+    # The prediction is reusable while the pixels, the scaler and the model are unchanged
+    def has_prediction(self, scaler_id, model_id):
+        return (self.has_bands() and os.path.exists(self.prediction_path)
+                and self.meta.get('scaler') == scaler_id and self.meta.get('model') == model_id)
+
+    def strip_bands(self, window):
+        with np.load(self.strip_path(window)) as strip:
+            return strip['bands']
+
+    def prediction(self):
+        return np.load(self.prediction_path, mmap_mode='r')
+
+    def valid(self, shape):
+        return np.load(self.valid_path, mmap_mode='r').reshape(shape)
+
+# Function to split a raster into strips of whole rows of about chunk_size pixels,
+# so each strip is one contiguous run of rows of the cached pixel-major arrays
+def strip_windows(height, width, chunk_size=1000000):
+    rows = max(1, chunk_size // width)
+    return [Window(0, row, width, min(rows, height - row)) for row in range(0, height, rows)]
+
+# Function to copy the pixels of a stack into the compressed strips of its date, with the valid-pixel mask
+def cache_bands(cache, chunk_size=1000000, tile=None):
+    shutil.rmtree(cache.bands_folder, ignore_errors=True)  # Strips of an older stack may have another height
+    os.makedirs(cache.bands_folder, exist_ok=True)
+    with rio.open(cache.stack_path) as src:
+        height, width = src.shape
+        cache.meta = {'stack': file_signature(cache.stack_path), 'shape': [height, width], 'strip_rows': max(1, chunk_size // width)}
+        valid = np.lib.format.open_memmap(cache.valid_path, mode='w+', dtype=bool, shape=(height * width,))
+        for window in cache.windows():
+            pixels = slice(window.row_off * width, (window.row_off + window.height) * width)
+            with timed('read', tile, pixels=window.width * window.height):
+                bands = src.read(window=window)
+            with timed('cache', tile, pixels=window.width * window.height):
+                valid[pixels] = valid_pixel_mask(bands.reshape([src.count, -1]))
+                temp_path = cache.strip_path(window).replace('.npz', '.tmp.npz')
+                np.savez_compressed(temp_path, bands=bands)
+                os.replace(temp_path, cache.strip_path(window))
+        valid.flush()
+        del valid
+
+    cache.save_meta()
+
+# Function to scale the cached pixels of a date and predict them, strip by strip, and cache the burn mask
+def cache_prediction(cache, model, params, scaler_id, model_id, tile=None):
+    height, width = cache.meta['shape']
+    valid = np.load(cache.valid_path, mmap_mode='r')
+    prediction = np.lib.format.open_memmap(cache.prediction_path, mode='w+', dtype=np.uint8, shape=(height, width))
+    for window in cache.windows():
+        pixels = slice(window.row_off * width, (window.row_off + window.height) * width)
+        strip_valid = np.asarray(valid[pixels])
+        strip_prediction = prediction[window.row_off:window.row_off + window.height].reshape(-1)
+        strip_prediction[:] = 0
+        n_valid = np.count_nonzero(strip_valid)
+        if n_valid == 0:
+            continue
+        bands = cache.strip_bands(window).reshape([-1, strip_valid.size])
+        if n_valid < strip_valid.size:
+            bands = bands[:, strip_valid]
+        with timed('scale', tile, pixels=n_valid):
+            features = preprocess_array(bands, params)
+        with timed('predict', tile, pixels=n_valid):
+            strip_prediction[strip_valid] = predict_array(model, features)
+    prediction.flush()
+    del prediction
+
+    cache.meta['scaler'] = scaler_id
+    cache.meta['model'] = model_id
+    cache.save_meta()
+
+# Function to write the pixels burnt at one date that were valid and unburnt at the date before
+def write_delta(previous, current, output_path, block_size=512, output_format='COG', compression='DEFLATE', tile=None):
+    with rio.open(current.stack_path) as src:
+        height, width = src.shape
+        stream_path = output_path + '.tmp.tif' if output_format == 'COG' else output_path
+        with timed('delta', tile, pixels=height * width):
+            previous_prediction = previous.prediction()
+            previous_valid = previous.valid((height, width))
+            current_prediction = current.prediction()
+            newly_burnt_pixels = 0
+            with open_prediction_geotiff(src, stream_path, block_size, compression) as dst:
+                for window in strip_windows(height, width, block_size * width):
+                    rows = slice(window.row_off, window.row_off + window.height)
+                    newly_burnt = (current_prediction[rows] == 1) & (previous_prediction[rows] != 1) & previous_valid[rows]
+                    newly_burnt_pixels += int(np.count_nonzero(newly_burnt))
+                    dst.write(newly_burnt.astype(np.uint8), 1, window=window)
+            if output_format == 'COG':
+                convert_to_cog(stream_path, output_path, block_size, compression)
+    return newly_burnt_pixels
+
+# Main function of the time-series mode: cache and predict only the dates of each tile that are not cached yet,
+# then write a "newly burnt since the date before" mask for each pair of consecutive dates of the tile
+# Returns {tile_id: [(previous date, date, delta path, newly burnt pixels), ...]} for the deltas written in this run
+def time_series_main(manifest=None,
+                     base_dir=r"raster",  # Directory containing the stacks of every date
+                     cache_dir=r"feature_cache",  # Directory of the cached features and predictions
+                     output_dir=r"raster_delta",  # Directory for the delta masks
+                     model_path=r"model/Model_LGBM.sav",
+                     scaler_path=r"model/min_max_scaler.pkl",
+                     backend='booster',
+                     chunk_size=1000000,  # Approximate number of pixels scaled / predicted at a time
+                     block_size=512,
+                     output_format='COG',
+                     compression='DEFLATE'):
+    os.makedirs(output_dir, exist_ok=True)
+
+    bundle = load_model_bundle(model_path, scaler_path)
+    model = make_backend(bundle.model, backend, model_path)
+    params = scaling_params(bundle.scaler)
+    scaler_id = file_hash(scaler_path)
+    model_id = file_hash(model_path)
+
+    # Settings that change the delta masks, so changing them invalidates older masks
+    settings = {'backend': backend, 'block_size': block_size, 'output_format': output_format, 'compression': compression}
+
+    deltas_by_tile = {}
+    for tile_id, dates in group_stacks_by_tile(base_dir).items():
+        print(f"\nTile {tile_id}: {len(dates)} date(s) ({', '.join(fire_date for fire_date, _ in dates)})")
+        caches = []
+        try:
+            for fire_date, stack_path in dates:
+                cache = DateCache(cache_dir, tile_id, fire_date, stack_path)
+                tile = f"{tile_id}_{fire_date}"
+                if not cache.has_bands():
+                    print(f"Caching {stack_path}")
+                    cache_bands(cache, chunk_size, tile)
+                if not cache.has_prediction(scaler_id, model_id):
+                    print(f"Predicting {tile_id} {fire_date}")
+                    cache_prediction(cache, model, params, scaler_id, model_id, tile)
+                if caches and cache.meta['shape'] != caches[-1].meta['shape']:
+                    raise ValueError(f"{stack_path} is not on the same grid as the earlier dates of the tile")
+                caches.append(cache)
+
+            for previous, current in zip(caches, caches[1:]):
+                output_path = os.path.join(output_dir, f"{tile_id}_{previous.fire_date.replace('-', '')}_{current.fire_date.replace('-', '')}_newburn.tif")
+                inputs = [previous.prediction_path, previous.valid_path, current.prediction_path]
+                if manifest is not None and manifest.is_up_to_date('delta', output_path, inputs, settings):
+                    continue
+                newly_burnt_pixels = write_delta(previous, current, output_path, block_size, output_format, compression, tile_id)
+                print(f"{tile_id} {previous.fire_date} -> {current.fire_date}: {newly_burnt_pixels} newly burnt pixels, '{output_path}'")
+                deltas_by_tile.setdefault(tile_id, []).append((previous.fire_date, current.fire_date, output_path, newly_burnt_pixels))
+                if manifest is not None:
+                    manifest.record('delta', output_path, inputs, settings)
+        except Exception as e:
+            print(f"An error occurred while processing tile {tile_id}: {e}")
+
+    return deltas_by_tile
+
+if __name__ == "__main__":
+    time_series_main()